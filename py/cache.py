@@ -0,0 +1,153 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import hashlib
+import json
+import os
+import time
+
+"""
+This file implements the content-addressed cache of the artifacts computed
+by FAST-R when memory=False (minhash signatures, projected test suites).
+An artifact is keyed by the sha1 of the input file, its kind and the
+parameters used to build it, so changing a parameter never reuses a stale
+artifact. Each artifact <key><suffix> has a manifest <key><suffix>.json with
+kind, input, parameters and build time. The cache directory is shared by
+concurrent jobs (artifacts and manifests are written atomically) and is
+bounded in size: the least recently used artifacts are evicted first.
+"""
+
+# cache directory (relative to the working directory unless FASTR_CACHE_DIR
+# is set, e.g. to a scratch disk shared by the jobs)
+CACHE_DIR = os.environ.get("FASTR_CACHE_DIR", "cache/")
+MAX_SIZE = 2**35  # bytes (32 GB)
+INPUTS = "inputs.json"  # memo of input hashes, key=path, val=(size, mtime, sha1)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# UTILS
+
+# write a file atomically (concurrent readers never see a partial file)
+def atomicWrite(path, data):
+    tmpfile = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmpfile, "w") as fout:
+        fout.write(data)
+    os.replace(tmpfile, path)
+
+def loadJSON(path):
+    try:
+        with open(path) as fin:
+            return json.load(fin)
+    except (IOError, ValueError):
+        return None
+
+# sha1 of the content of input_file (memoized by path, size and mtime)
+def fileHash(input_file, cache_dir=CACHE_DIR, block=2**20):
+    stat = os.stat(input_file)
+    path = os.path.abspath(input_file)
+    memo_file = os.path.join(cache_dir, INPUTS)
+    memo = loadJSON(memo_file) or {}
+    if path in memo and memo[path][:2] == [stat.st_size, stat.st_mtime]:
+        return memo[path][2]
+
+    sha1 = hashlib.sha1()
+    with open(input_file, "rb") as fin:
+        for data in iter(lambda: fin.read(block), b""):
+            sha1.update(data)
+    # re-read the memo: other jobs may have updated it meanwhile
+    memo = loadJSON(memo_file) or {}
+    memo[path] = [stat.st_size, stat.st_mtime, sha1.hexdigest()]
+    atomicWrite(memo_file, json.dumps(memo, sort_keys=True, indent=1))
+    return sha1.hexdigest()
+
+# key of the artifact of kind built from input_file with params
+def artifactKey(input_file, kind, params, cache_dir=CACHE_DIR):
+    description = {"input": fileHash(input_file, cache_dir), "kind": kind,
+                   "params": params}
+    data = json.dumps(description, sort_keys=True).encode("utf-8")
+    return "{}-{}".format(kind, hashlib.sha1(data).hexdigest())
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# CACHE
+
+# path of the (cached or newly built) artifact and its build time
+def cached(input_file, kind, params, suffix, build, cache_dir=CACHE_DIR,
+           max_size=MAX_SIZE):
+    """INPUT
+    (str)input_file: path of the input of the artifact
+    (str)kind: kind of artifact, e.g. "signatures"
+    (dict)params: parameters of the artifact (JSON serializable)
+    (str)suffix: suffix of the artifact file, e.g. ".sig"
+    (fun)build: build(path) writes the artifact at path (atomically)
+    (str)cache_dir: cache directory
+    (int)max_size: max size of the cache directory in bytes
+
+    OUTPUT
+    (str)path: path of the artifact
+    (float)build_time: time spent to build the artifact"""
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+
+    path = os.path.join(cache_dir,
+                        artifactKey(input_file, kind, params, cache_dir) +
+                        suffix)
+    manifest = loadJSON(path + ".json")
+    if manifest is not None and os.path.exists(path):
+        os.utime(path)  # last use, for the eviction
+        return path, manifest["build_time"]
+
+    # wall-clock time (the build may run in worker processes)
+    t0 = time.perf_counter()
+    build(path)
+    build_time = time.perf_counter() - t0
+
+    manifest = {"kind": kind, "input": os.path.abspath(input_file),
+                "params": params, "build_time": build_time,
+                "created": time.time(), "size": os.path.getsize(path)}
+    atomicWrite(path + ".json", json.dumps(manifest, sort_keys=True,
+                                           indent=1))
+    evict(cache_dir, max_size, keep=path)
+    return path, build_time
+
+# artifacts of the cache directory as tuples (last use, size, path)
+def artifacts(cache_dir=CACHE_DIR):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json") or name == INPUTS:
+            continue
+        path = os.path.join(cache_dir, name[:-len(".json")])
+        try:
+            entries.append((os.path.getmtime(path), os.path.getsize(path),
+                            path))
+        except OSError:  # being built, or evicted by another job
+            continue
+    return entries
+
+# remove the least recently used artifacts until the cache fits max_size
+def evict(cache_dir=CACHE_DIR, max_size=MAX_SIZE, keep=None):
+    entries = sorted(artifacts(cache_dir))
+    size = sum(entry[1] for entry in entries)
+    for last_use, entry_size, path in entries:
+        if size <= max_size:
+            break
+        if path == keep:
+            continue
+        for filename in (path + ".json", path):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        size -= entry_size
@@ -16,11 +16,15 @@ along with this source.  If not, see <http://www.gnu.org/licenses/>.
 from collections import defaultdict
 from collections import OrderedDict
 from functools import reduce
-import random
 import time
 import sys
 
+import numpy as np
+
+import coverage
+import loader
 import lsh
+import sampling
 
 
 """
@@ -33,27 +37,29 @@ Each function returns: preparation time, reduction time, reduced test suite.
 """
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-# utility function that loads test suites 
-# format: source code of one test case per line (bbox)
-# format: space-separated covered entities of one test case per line (wbox)
-def loadTestSuite(input_file, bbox=False, k=5):
-    TS = {}
-    with open(input_file) as fin:
-        tcID = 1
-        for tc in fin:
-            if bbox:
-                TS[tcID] = tc[:-1]
-            else:
-                TS[tcID] = set(tc[:-1].split())
-            tcID += 1
-    shuffled = list(TS.keys())
-    random.shuffle(shuffled)
-    newTS = OrderedDict()
-    for key in shuffled:
-        newTS[key] = TS[key]
-    if bbox:
-        newTS = lsh.kShingles(TS, k)
-    return newTS
+
+# minimum distance of the candidates C to the selected tcs P, updated lazily:
+# mind[c] is the minimum over P[:upto[c]], so only the tcs selected since the
+# last time c was a candidate are compared with c
+def minDistances(distance, P, C, mind, upto):
+    """INPUT
+    (fun)distance: distance(C, Q) -> len(C) x len(Q) matrix of distances
+    (list)P: selected tcs
+    (list)C: candidate tcs
+    (np.array)mind, upto: running minimum and number of compared tcs of P,
+    indexed by tcID (updated in place)
+
+    OUTPUT
+    (np.array)distances: minimum distance of each candidate to P"""
+    C = np.asarray(C, dtype=np.int64)
+    lo = int(upto[C].min())
+    if lo < len(P):
+        D = np.asarray(distance(C, P[lo:]), dtype=np.float64)
+        # distances to tcs already compared are not needed again
+        D[np.arange(len(P) - lo)[None, :] < (upto[C] - lo)[:, None]] = np.inf
+        mind[C] = np.minimum(mind[C], D.min(axis=1))
+        upto[C] = len(P)
+    return mind[C]
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -61,17 +67,12 @@ def loadTestSuite(input_file, bbox=False, k=5):
 
 # GREEDY SET COVER (ADDITIONAL)
 def ga(input_file, B=0):
-    def select(TS, U, Cg):
-        s, uncs_s = 0, -1
-        for ui in U:
-            uncs = len(TS[ui] - Cg)
-            if uncs > uncs_s:
-                s, uncs_s = ui, uncs
-        return s
+    def uncovered(ui):
+        return len(TS[ui] - Cg)
 
     ptime_start = time.clock()
 
-    TCS = loadTestSuite(input_file)
+    TCS = loader.loadTestSuite(input_file)
     TS = OrderedDict(sorted(TCS.items(), key=lambda t: -len(t[1])))
 
     # budget B modification
@@ -86,10 +87,14 @@ def ga(input_file, B=0):
 
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
 
+    # lazy greedy selection (ties: first in U)
+    greedy = coverage.lazyGreedy(list(U), uncovered)
     while len(U) > 0:
         if len(Cg) == maxC:
             Cg = set()
-        s = select(TS, U, Cg)
+            # the gains grow back: restart from the remaining tcs
+            greedy = coverage.lazyGreedy(list(U), uncovered)
+        s = next(greedy)
         P.append(s)
 
         # select budget B
@@ -106,17 +111,12 @@ def ga(input_file, B=0):
 
 # GREEDY SET COVER (ADDITIONAL and ADEQUATE)
 def gaAdequacy(input_file):
-    def select(TS, U, Cg):
-        s, uncs_s = 0, -1
-        for ui in U:
-            uncs = len(TS[ui] - Cg)
-            if uncs > uncs_s:
-                s, uncs_s = ui, uncs
-        return s
+    def uncovered(ui):
+        return len(TS[ui] - Cg)
 
     ptime_start = time.clock()
 
-    TCS = loadTestSuite(input_file)
+    TCS = loader.loadTestSuite(input_file)
     TS = OrderedDict(sorted(TCS.items(), key=lambda t: -len(t[1])))
 
     U = TS.copy()
@@ -127,10 +127,12 @@ def gaAdequacy(input_file):
 
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
 
+    # lazy greedy selection (ties: first in U)
+    greedy = coverage.lazyGreedy(list(U), uncovered)
     while len(U) > 0:
         if len(Cg) == maxC:
             break
-        s = select(TS, U, Cg)
+        s = next(greedy)
         P.append(s)
 
         Cg = Cg | U[s]
@@ -149,42 +151,40 @@ def artd(input_file, B=0):
     def generate(U):
         C, T = set(), set()
         while True:
-            ui = random.choice(list(U.keys()))
-            S = U[ui]
-            if T | S == T:
+            ui = U.choice()
+            S = TS[ui]
+            if S <= T:
                 break
-            T = T | S
+            T |= S
             C.add(ui)
         return C
 
-    def select(TS, P, C):
-        D = {}
-        for cj in C:
-            D[cj] = {}
-            for pi in P:
-                D[cj][pi] = lsh.jDistance(TS[pi], TS[cj])
+    def select(P, C):
+        C = list(C)
+        D = minDistances(distance, P, C, mind, upto)
         # maximum among the minimum distances
-        j, jmax = 0, -1
-        for cj in D.keys():
-            min_di = min(D[cj].values())
-            if min_di > jmax:
-                j, jmax = cj, min_di
-        return j
+        return C[int(np.argmax(D))]
 
     # # # # # # # # # # # # # # # # # # # # # #
 
     ptime_start = time.clock()
 
-    TS = loadTestSuite(input_file)
+    TS = loader.loadTestSuite(input_file)
+    bits, entities = coverage.bitsets(TS)
+
+    def distance(C, Q):
+        return lsh.jDistanceBitsets(bits[C], bits[Q])
 
     # budget B modification
     if B == 0:
         B = len(TS)
 
-    U = TS.copy()
+    U = sampling.CompactSet(TS.keys())
 
     TS[0] = set()
     P = [0]
+    mind = np.full(len(bits), np.inf)
+    upto = np.zeros(len(bits), dtype=np.int64)
 
     C = generate(U)
 
@@ -198,14 +198,14 @@ def artd(input_file, B=0):
 
         if len(C) == 0:
             C = generate(U)
-        s = select(TS, P, C)
+        s = select(P, C)
         P.append(s)
 
         # select budget B
         if len(P) >= B+1:
             break
 
-        del U[s]
+        U.remove(s)
         C = C - set([s])
 
     ptime = time.clock() - ptime_start
@@ -219,42 +219,40 @@ def artdAdequacy(input_file, B=0):
     def generate(U):
         C, T = set(), set()
         while True:
-            ui = random.choice(list(U.keys()))
-            S = U[ui]
-            if T | S == T:
+            ui = U.choice()
+            S = TS[ui]
+            if S <= T:
                 break
-            T = T | S
+            T |= S
             C.add(ui)
         return C
 
-    def select(TS, P, C):
-        D = {}
-        for cj in C:
-            D[cj] = {}
-            for pi in P:
-                D[cj][pi] = lsh.jDistance(TS[pi], TS[cj])
+    def select(P, C):
+        C = list(C)
+        D = minDistances(distance, P, C, mind, upto)
         # maximum among the minimum distances
-        j, jmax = 0, -1
-        for cj in D.keys():
-            min_di = min(D[cj].values())
-            if min_di > jmax:
-                j, jmax = cj, min_di
-        return j
+        return C[int(np.argmax(D))]
 
     # # # # # # # # # # # # # # # # # # # # # #
 
     ptime_start = time.clock()
 
-    TS = loadTestSuite(input_file)
+    TS = loader.loadTestSuite(input_file)
+    bits, entities = coverage.bitsets(TS)
+
+    def distance(C, Q):
+        return lsh.jDistanceBitsets(bits[C], bits[Q])
 
     # budget B modification
     if B == 0:
         B = len(TS)
 
-    U = TS.copy()
+    U = sampling.CompactSet(TS.keys())
 
     TS[0] = set()
     P = [0]
+    mind = np.full(len(bits), np.inf)
+    upto = np.zeros(len(bits), dtype=np.int64)
 
     Cg = set()
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
@@ -272,15 +270,15 @@ def artdAdequacy(input_file, B=0):
 
         if len(C) == 0:
             C = generate(U)
-        s = select(TS, P, C)
+        s = select(P, C)
         P.append(s)
 
         # select budget B
         if len(P) >= B+1:
             break
 
-        Cg = Cg | U[s]
-        del U[s]
+        Cg = Cg | TS[s]
+        U.remove(s)
         C = C - set([s])
 
     ptime = time.clock() - ptime_start
@@ -292,52 +290,45 @@ def artdAdequacy(input_file, B=0):
 
 
 # ZHOU (ART-F)
-# fixed size candidate set + manhattan distance
+# fixed size candidate set + manhattan distance (on coverage vectors)
 def artf(input_file, B=0):
     def generate(U):
         C = set()
         if len(U) < 10:
             C = set(U.keys())
         else:
-            keys = list(U.keys())
             while len(C) < 10:
-                ui = random.choice(keys)
+                ui = U.choice()
                 C.add(ui)
         return C
 
-    def manhattanDistance(TCS, i, j):
-        u, v = TCS[i], TCS[j]
-        return sum([abs(float(ui) - float(vi)) for ui, vi in zip(u, v)])
-
-    def select(TS, P, C):
-        D = {}
-        for cj in C:
-            D[cj] = {}
-            for pi in P:
-                D[cj][pi] = manhattanDistance(TS, pi, cj)
+    def select(P, C):
+        C = list(C)
+        D = minDistances(distance, P, C, mind, upto)
         # maximum among the minimum distances
-        j, jmax = 0, -1
-        for cj in D.keys():
-            min_di = min(D[cj].values())
-            if min_di > jmax:
-                j, jmax = cj, min_di
-
-        return j
+        return C[int(np.argmax(D))]
 
     # # # # # # # # # # # # # # # # # # # # # #
 
     ptime_start = time.clock()
 
-    TS = loadTestSuite(input_file)
+    TS = loader.loadTestSuite(input_file)
+    bits, entities = coverage.bitsets(TS)
+
+    # manhattan distance between the 0/1 coverage vectors
+    def distance(C, Q):
+        return lsh.manhattanDistanceBitsets(bits[C], bits[Q])
 
     # budget B modification
     if B == 0:
         B = len(TS)
 
-    U = TS.copy()
+    U = sampling.CompactSet(TS.keys())
 
     TS[0] = set()
     P = [0]
+    mind = np.full(len(bits), np.inf)
+    upto = np.zeros(len(bits), dtype=np.int64)
 
     C = generate(U)
 
@@ -351,14 +342,14 @@ def artf(input_file, B=0):
 
         if len(C) == 0:
             C = generate(U)
-        s = select(TS, P, C)
+        s = select(P, C)
         P.append(s)
 
         # select budget B
         if len(P) >= B+1:
             break
 
-        del U[s]
+        U.remove(s)
         C = C - set([s])
 
     ptime = time.clock() - ptime_start
@@ -367,52 +358,45 @@ def artf(input_file, B=0):
 
 
 # ZHOU (ART-F ADEQUATE)
-# fixed size candidate set + manhattan distance
+# fixed size candidate set + manhattan distance (on coverage vectors)
 def artfAdequacy(input_file, B=0):
     def generate(U):
         C = set()
         if len(U) < 10:
             C = set(U.keys())
         else:
-            keys = list(U.keys())
             while len(C) < 10:
-                ui = random.choice(keys)
+                ui = U.choice()
                 C.add(ui)
         return C
 
-    def manhattanDistance(TCS, i, j):
-        u, v = TCS[i], TCS[j]
-        return sum([abs(float(ui) - float(vi)) for ui, vi in zip(u, v)])
-
-    def select(TS, P, C):
-        D = {}
-        for cj in C:
-            D[cj] = {}
-            for pi in P:
-                D[cj][pi] = manhattanDistance(TS, pi, cj)
+    def select(P, C):
+        C = list(C)
+        D = minDistances(distance, P, C, mind, upto)
         # maximum among the minimum distances
-        j, jmax = 0, -1
-        for cj in D.keys():
-            min_di = min(D[cj].values())
-            if min_di > jmax:
-                j, jmax = cj, min_di
-
-        return j
+        return C[int(np.argmax(D))]
 
     # # # # # # # # # # # # # # # # # # # # # #
 
     ptime_start = time.clock()
 
-    TS = loadTestSuite(input_file)
+    TS = loader.loadTestSuite(input_file)
+    bits, entities = coverage.bitsets(TS)
+
+    # manhattan distance between the 0/1 coverage vectors
+    def distance(C, Q):
+        return lsh.manhattanDistanceBitsets(bits[C], bits[Q])
 
     # budget B modification
     if B == 0:
         B = len(TS)
 
-    U = TS.copy()
+    U = sampling.CompactSet(TS.keys())
 
     TS[0] = set()
     P = [0]
+    mind = np.full(len(bits), np.inf)
+    upto = np.zeros(len(bits), dtype=np.int64)
 
     Cg = set()
     maxC = len(reduce(lambda x, y: x | y, TS.values()))
@@ -430,18 +414,17 @@ def artfAdequacy(input_file, B=0):
 
         if len(C) == 0:
             C = generate(U)
-        s = select(TS, P, C)
+        s = select(P, C)
         P.append(s)
 
         # select budget B
         if len(P) >= B+1:
             break
 
-        Cg = Cg | U[s]
-        del U[s]
+        Cg = Cg | TS[s]
+        U.remove(s)
         C = C - set([s])
 
     ptime = time.clock() - ptime_start
 
     return 0.0, ptime, P[1:]
-
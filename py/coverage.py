@@ -0,0 +1,156 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import heapq
+
+import numpy as np
+
+"""
+This file contains compact representations of the coverage information
+(format: space-separated covered entities of one test case per line)
+used by the white-box algorithms.
+"""
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# PACKED BITSETS
+
+# pack the coverage of a test suite into uint64 bitsets
+def bitsets(TS):
+    """INPUT
+    (dict)TS: key=tcID (positive int), value=set of covered entities
+
+    OUTPUT
+    (np.array)bitsets: (max tcID + 1) x W uint64 matrix, row tcID is the
+    bitset of entities covered by tcID (row 0 is the empty test case)
+    (dict)entities: key=entity, value=bit index"""
+    entities = {}
+    rows, cols = [], []
+    for tcID, tc in TS.items():
+        for entity in tc:
+            rows.append(tcID)
+            cols.append(entities.setdefault(entity, len(entities)))
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+
+    words = (len(entities) + 63) // 64
+    bits = np.zeros((max(TS.keys(), default=0) + 1, max(words, 1)),
+                    dtype=np.uint64)
+    np.bitwise_or.at(bits, (rows, cols >> 6),
+                     np.left_shift(np.uint64(1), (cols & 63).astype(np.uint64)))
+    return bits, entities
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# INVERTED INDEX
+
+class CoverageIndex:
+    """Residual coverage of a test suite as an inverted index (CSR arrays
+    entity -> test cases and test case -> entities) with one counter of
+    not yet covered entities per test case. Covering a test case decrements
+    only the test cases sharing its newly covered entities, so a selection
+    costs the size of the coverage it touches, not the size of the suite.
+    A test case whose counter reaches zero is useless; test cases not in C
+    cover no entity.
+
+    INPUT
+    (dict)C: key=test case (tcID or row), val=set of covered entities"""
+
+    def __init__(self, C):
+        self.keys = list(C.keys())
+        self.slots = {tc: i for i, tc in enumerate(self.keys)}
+        entities = {}
+        cols = [entities.setdefault(entity, len(entities))
+                for tc in self.keys for entity in C[tc]]
+        sizes = np.array([len(C[tc]) for tc in self.keys], dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        rows = np.repeat(np.arange(len(self.keys), dtype=np.int64), sizes)
+        self.numOfEntities = len(entities)
+
+        # test case -> entities
+        self.tcPtr = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.tcPtr[1:])
+        self.tcEntities = cols
+        # entity -> test cases
+        order = np.argsort(cols, kind="stable")
+        self.entityPtr = np.zeros(self.numOfEntities + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=self.numOfEntities),
+                  out=self.entityPtr[1:])
+        self.entityTCs = rows[order]
+
+        self.residuals = sizes
+        self.covered = np.zeros(self.numOfEntities, dtype=bool)
+        self.numCovered = 0
+        # test cases useless from the start (reported at the first cover)
+        self.useless = [self.keys[i] for i in np.flatnonzero(sizes == 0)]
+
+    def adequate(self):
+        return self.numCovered == self.numOfEntities
+
+    # number of entities of tc not covered yet
+    def residual(self, tc):
+        if tc not in self.slots:
+            return 0
+        return int(self.residuals[self.slots[tc]])
+
+    # cover the entities of tc and return the test cases made useless
+    def cover(self, tc):
+        useless, self.useless = self.useless, []
+        if tc not in self.slots:
+            return useless
+        i = self.slots[tc]
+        new = self.tcEntities[self.tcPtr[i]:self.tcPtr[i+1]]
+        new = new[~self.covered[new]]
+        if len(new) == 0:
+            return useless
+        self.covered[new] = True
+        self.numCovered += len(new)
+
+        starts, ends = self.entityPtr[new], self.entityPtr[new + 1]
+        lengths = ends - starts
+        # positions of the test cases of the new entities in entityTCs
+        offsets = np.repeat(ends - np.cumsum(lengths), lengths)
+        tcs = self.entityTCs[np.arange(len(offsets)) + offsets]
+        np.subtract.at(self.residuals, tcs, 1)
+        tcs = np.unique(tcs)
+        useless.extend(self.keys[j] for j in tcs[self.residuals[tcs] == 0])
+        return useless
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# LAZY GREEDY
+
+# greedy order of candidates by marginal gain (lazy greedy, CELF)
+def lazyGreedy(candidates, gain):
+    """INPUT
+    (list)candidates: test cases, in order of preference among equal gains
+    (fun)gain: gain(tc) -> current marginal gain of tc (must not increase
+    as test cases are selected, e.g. number of entities not covered yet)
+
+    OUTPUT
+    (generator)selected: at each step, the first candidate of maximum gain,
+    as max(remaining candidates, key=gain); the caller updates the state of
+    gain (covers the selected test case) before asking for the next one.
+
+    The heap holds the stale gains, upper bounds of the current ones: only
+    the top is re-evaluated, and it is selected if it is still the top."""
+    heap = [(-gain(tc), i, tc) for i, tc in enumerate(candidates)]
+    heapq.heapify(heap)
+    while len(heap) > 0:
+        stale, i, tc = heapq.heappop(heap)
+        current = -gain(tc)
+        if len(heap) > 0 and (current, i) > heap[0][:2]:
+            heapq.heappush(heap, (current, i, tc))
+            continue
+        yield tc
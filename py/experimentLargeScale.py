@@ -29,7 +29,7 @@ in the Large-scale scenario and in all input test suite.
 usage = """USAGE: python3 py/experimentLargeScale.py <algorithm> <repetitions>
 OPTIONS:
   <algorithm>: the test suite reduction algorithm.
-    options: FAST++, FAST-CS, FAST-pw, FAST-all
+    options: FAST++, FAST++||, FAST-CS, FAST-pw, FAST-all
   <repetitions>: number of times the test suite reduction should be computed.
     options: positive integer value, e.g. 50"""
 
@@ -39,7 +39,7 @@ if __name__ == "__main__":
         print(usage)
         exit()
 
-    ALGS = ["FAST++", "FAST-CS", "FAST-pw", "FAST-all"]
+    ALGS = ["FAST++", "FAST++||", "FAST-CS", "FAST-pw", "FAST-all"]
     script, alg, rep = sys.argv
     repetitions = int(rep)
 
@@ -80,6 +80,18 @@ if __name__ == "__main__":
             print("FAST++", reduction+1, pTime, rTime)
 
 
+    if alg == "FAST++||":
+        for reduction in range(repetitions):
+            B = int(numOfTCS * reduction / 100)
+            pTime, rTime, sel = fastr.fastPlusPlus(
+                inputFile, dim=dim, B=B, memory=False, mode="parallel")
+            sOut = "{}/{}-{}.pickle".format(sPath, "FAST++||", reduction+1)
+            pickle.dump(sel, open(sOut, "wb"))
+            tOut = "{}/{}-{}.pickle".format(tPath, "FAST++||", reduction+1)
+            pickle.dump((pTime, rTime), open(tOut, "wb"))
+            print("FAST++||", reduction+1, pTime, rTime)
+
+
     if alg == "FAST-CS":
         for reduction in range(repetitions):
             B = int(numOfTCS * reduction / 100)
@@ -0,0 +1,130 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import random
+import sys
+
+import numpy as np
+
+import fastr
+import loader
+import lsh
+import metric
+
+"""
+This file compares the vectorized minhash engines (lsh.minhashFamily and the
+one permutation hashing lsh.onePermutationFamily) with the reference one
+(lsh.hashFamily): error of the Jaccard estimates on random pairs of test
+cases, fraction of wrong bins of union signatures merged with np.minimum
+(what FAST-pw does with the selected test cases, expected 0) and fault
+detection loss of FAST-pw in the Budget scenario.
+"""
+
+
+usage = """USAGE: python3 py/experimentMinhash.py <coverageType> <program> <version> <repetitions>
+OPTIONS:
+  <coverageType>: the target coverage criterion.
+    options: function, line, branch
+  <program> <version>: the target subject and its respective version.
+    options: flex v3, grep v3, gzip v1, make v1, sed v6, chart v0, closure v0, lang v0, math v0, time v0
+  <repetitions>: number of times the test suite reduction should be computed.
+    options: positive integer value, e.g. 50"""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print(usage)
+        exit()
+
+    D4J = [("math", "v1"), ("closure", "v1"), ("time", "v1"), ("lang", "v1"), ("chart", "v1")]
+    script, covType, prog, v, rep = sys.argv
+    repeats = int(rep)
+
+    # FAST parameters
+    k, n, r, b = 5, 10, 1, 10
+    pairs = 1000
+    merges = 50
+
+    javaFlag = True if ((prog, v) in D4J) else False
+
+    inputFile = "input/{}_{}/{}-bbox.txt".format(prog, v, prog)
+    wBoxFile = "input/{}_{}/{}-{}.txt".format(prog, v, prog, covType)
+    if javaFlag:
+        faultMatrix = "input/{}_{}/fault_matrix.txt".format(prog, v)
+    else:
+        faultMatrix = "input/{}_{}/fault_matrix_key_tc.pickle".format(prog, v)
+
+    # JACCARD ESTIMATES
+    for bbox, fileName in [(True, inputFile), (False, wBoxFile)]:
+        TS = loader.loadTestSuite(fileName, bbox=bbox, k=k)
+        reference = [lsh.hashFamily(i) for i in range(n)]
+        tc_IDs, signatures = lsh.suiteMinhashing(TS.items(),
+                                                 lsh.minhashFamily(n))
+        vectorized = dict(zip(tc_IDs, signatures))
+        tc_IDs, signatures = lsh.suiteMinhashing(TS.items(),
+                                                 lsh.onePermutationFamily(n))
+        oph = dict(zip(tc_IDs, signatures))
+
+        errors = {"reference": [], "vectorized": [], "oph": []}
+        for _ in range(pairs):
+            i, j = random.sample(tc_IDs, 2)
+            if len(set(TS[i]) | set(TS[j])) == 0:
+                continue
+            exact = lsh.jSimilarity(set(TS[i]), set(TS[j]))
+            estimate = lsh.jSimilarityEstimate(
+                lsh.tcMinhashing((i, TS[i]), reference),
+                lsh.tcMinhashing((j, TS[j]), reference))
+            errors["reference"].append(estimate - exact)
+            estimate = lsh.jSimilarityEstimate(vectorized[i], vectorized[j])
+            errors["vectorized"].append(estimate - exact)
+            estimate = lsh.jSimilarityEstimate(oph[i], oph[j])
+            errors["oph"].append(estimate - exact)
+
+        for engine, error in sorted(errors.items()):
+            bias = sum(error) / len(error)
+            mae = sum(abs(e) for e in error) / len(error)
+            print("Jaccard", "bbox" if bbox else covType, engine, bias, mae)
+
+        # UNION SIGNATURES (one permutation hashing is merged undensified)
+        families = [("vectorized", lsh.minhashFamily(n), None),
+                    ("oph", lsh.onePermutationFamily(n, densified=False),
+                     lsh.densification(n))]
+        selected = random.sample(tc_IDs, min(merges, len(tc_IDs)))
+        union = np.unique(np.concatenate(
+            [lsh.shingleArray(TS[i]) for i in selected]))
+        for engine, family, densify in families:
+            signatures = lsh.suiteMinhashing(
+                ((i, lsh.shingleArray(TS[i])) for i in selected), family)[1]
+            merged = signatures.min(axis=0)
+            direct = lsh.suiteMinhashing([(0, union)], family)[1][0]
+            if densify is not None:
+                merged, direct = densify(merged), densify(direct)
+            print("Union", "bbox" if bbox else covType, engine,
+                  np.mean(merged != direct))
+
+    # FAST-pw SELECTION
+    numOfTCS = sum((1 for _ in open(inputFile)))
+    B = int(numOfTCS * 10 / 100)
+    engines = [("reference", False, False), ("vectorized", True, False),
+               ("oph", True, True)]
+    for engine, vectorized, oph in engines:
+        mhTimes, fdls = [], []
+        for run in range(repeats):
+            mhTime, rTime, sel = fastr.fast_pw(
+                inputFile, r, b, bbox=True, k=k, memory=True, B=B,
+                vectorized=vectorized, oph=oph)
+            mhTimes.append(mhTime)
+            fdls.append(metric.fdl(sel, faultMatrix, javaFlag))
+        print("FAST-pw", engine, sum(mhTimes) / repeats, sum(fdls) / repeats)
@@ -13,23 +13,28 @@ You should have received a copy of the GNU General Public License
 along with this source.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-from collections import defaultdict
-from collections import OrderedDict
+import io
+import itertools
 import math
+import multiprocessing
 import os
-import pickle
 import random
 import sys
 import time
 
 from functools import reduce
 import numpy as np
+import scipy.sparse
 
 from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.random_projection import johnson_lindenstrauss_min_dim
 from sklearn.random_projection import SparseRandomProjection
 
+import cache
+import loader
 import lsh
+import sampling
+import sigstore
 
 
 """
@@ -38,396 +43,645 @@ This file implements FAST-R test suite reduction algorithms.
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-# utility function to load test suite
-def loadTestSuite(input_file, bbox=False, k=5):
-    TS = defaultdict()
-    with open(input_file) as fin:
-        tcID = 1
-        for tc in fin:
-            if bbox:
-                TS[tcID] = tc[:-1]
-            else:
-                TS[tcID] = set(tc[:-1].split())
-            tcID += 1
-    shuffled = list(TS.keys())
-    random.shuffle(shuffled)
-    newTS = OrderedDict()
-    for key in shuffled:
-        newTS[key] = TS[key]
-    if bbox:
-        newTS = lsh.kShingles(TS, k)
-    return newTS
-
-# store signatures on disk for future re-use
-def storeSignatures(input_file, sigfile, hashes, bbox=False, k=5):
-    with open(sigfile, "w") as sigfile:
-        with open(input_file) as fin:
-            tcID = 1
-            for tc in fin:
-                if bbox:
-                    # shingling
-                    tc_ = tc[:-1]
-                    tc_shingles = set()
-                    for i in range(len(tc_) - k + 1):
-                        tc_shingles.add(hash(tc_[i:i + k]))
-
-                    sig = lsh.tcMinhashing((tcID, set(tc_shingles)), hashes)
-                else:
-                    tc_ = tc[:-1].split()
-                    sig = lsh.tcMinhashing((tcID, set(tc_)), hashes)
-                for hash_ in sig:
-                    sigfile.write(hash_)
-                    sigfile.write(" ")
-                sigfile.write("\n")
-                tcID += 1
-
-# load stored signatures
-def loadSignatures(input_file):
-    sig = {}
-    start = time.clock()
-    with open(input_file, "r") as fin:
-        tcID = 1
-        for tc in fin:
-            sig[tcID] = [i.strip() for i in tc[:-1].split()]
-            tcID += 1
-    return sig, time.clock() - start
-
-
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-
-
-# FAST-PW (pairwise comparison with candidate set)
-def fast_pw(input_file, r, b, bbox=False, k=5, memory=False, B=0):
+# minhash signatures with the reference (non vectorized) engine, as uint64
+def legacyMinhashing(test_cases, hashes):
+    for tc in test_cases:
+        yield [tc[0]], np.array([[int(hash_, 16) for hash_ in
+                                  lsh.tcMinhashing(tc, hashes)]],
+                                dtype=np.uint64)
+
+# byte ranges [lo, hi) of input_file of about size bytes, aligned to lines
+def lineChunks(input_file, size):
+    end = os.path.getsize(input_file)
+    offsets = [0]
+    with open(input_file, "rb") as fin:
+        while offsets[-1] + size < end:
+            fin.seek(offsets[-1] + size)
+            fin.readline()
+            if fin.tell() >= end:
+                break
+            offsets.append(fin.tell())
+    offsets.append(end)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+# parameters of the signature workers (set by initSigner)
+_signer = None
+
+def initSigner(input_file, hashes, bbox, k, vectorized):
+    global _signer
+    _signer = (input_file, hashes, bbox, k, vectorized)
+
+# signatures of the test cases in the byte range [lo, hi) of the input file
+def minhashChunk(task):
+    lo, hi = task
+    input_file, hashes, bbox, k, vectorized = _signer
+    with open(input_file, "rb") as fin:
+        fin.seek(lo)
+        data = fin.read(hi - lo)
+    # same decoding and newline translation as loader.readTestCases
+    lines = io.TextIOWrapper(io.BytesIO(data))
+    test_cases = ((0, loader.parseTestCase(loader.stripLine(tc), bbox, k))
+                  for tc in lines)
+    if vectorized:
+        chunks = lsh.chunkMinhashing(test_cases, hashes)
+    else:
+        chunks = legacyMinhashing(test_cases, hashes)
+    return np.concatenate([sigs for _, sigs in chunks])
+
+# store signatures on disk for future re-use (binary store, see sigstore)
+# processes > 1: chunks of lines are minhashed in parallel (same output)
+# (processes=None: one per cpu)
+def storeSignatures(input_file, sigfile, hashes, r, b, bbox=False, k=5,
+                    vectorized=True, oph=False, processes=1, chunk=2**23):
+    if processes is None:
+        processes = os.cpu_count() or 1
+    ranges = lineChunks(input_file, chunk)
+
+    if processes <= 1 or len(ranges) <= 1:
+        test_cases = loader.readTestCases(input_file, bbox=bbox, k=k)
+        if vectorized:
+            chunks = lsh.chunkMinhashing(test_cases, hashes)
+        else:
+            chunks = legacyMinhashing(test_cases, hashes)
+        sigstore.storeSignatures(sigfile, (sigs for _, sigs in chunks),
+                                 r, b, k, oph)
+        return
+
+    context = multiprocessing.get_context("fork")
+    with context.Pool(processes, initializer=initSigner,
+                      initargs=(input_file, hashes, bbox, k,
+                                vectorized)) as pool:
+        # imap returns the chunks in order of the input file
+        sigstore.storeSignatures(sigfile, pool.imap(minhashChunk, ranges),
+                                 r, b, k, oph)
+
+# load stored signatures (memory-mapped, pages are shared among processes)
+def loadSignatures(sigfile):
+    """INPUT
+    (str)sigfile: path of the signature store
+
+    OUTPUT
+    (list)tc_IDs: IDs of the test cases (line numbers, from 1)
+    (np.array)signatures: read-only matrix of signatures, one row per tcID"""
+    header, signatures = sigstore.loadSignatures(sigfile)
+    return list(range(1, header["count"] + 1)), signatures
+
+# compute (memory=True) or load (memory=False) the minhash signatures
+def minhashSignatures(input_file, r, b, bbox=False, k=5, memory=False,
+                      vectorized=True, oph=False, processes=1):
+    """INPUT
+    (str)input_file: path of the test suite
+    (int)r, b: number of rows and bands (r*b hash functions)
+    (bool)memory: compute signatures in memory instead of using the store
+    (bool)vectorized, oph: minhash engine (see lsh)
+    (int)processes: worker processes building the store (None: one per cpu)
+
+    OUTPUT
+    (float)mh_time: time to compute the signatures
+    (list)tc_IDs: IDs of the test cases (shuffled if memory)
+    (np.array)signatures: uint64 matrix of signatures, one row per tcID
+    (oph: undensified, see lsh.densification)"""
     n = r * b  # number of hash functions
 
-    hashes = [lsh.hashFamily(i) for i in range(n)]
+    if not vectorized:
+        hashes = [lsh.hashFamily(i) for i in range(n)]
+    elif oph:
+        hashes = lsh.onePermutationFamily(n, densified=False)
+    else:
+        hashes = lsh.minhashFamily(n)
 
     if memory:
-        test_suite = loadTestSuite(input_file, bbox=bbox, k=k)
+        test_suite = loader.loadTestSuite(input_file, bbox=bbox, k=k)
         # generate minhashes signatures
         mh_t = time.clock()
-        tcs_minhashes = {tc[0]: lsh.tcMinhashing(tc, hashes)
-                         for tc in test_suite.items()}
-        mh_time = time.clock() - mh_t
-        ptime_start = time.clock()
-
-    else:
-        # loading input file and generating minhashes signatures
-        sigfile = input_file.replace(".txt", ".sig")
-        sigtimefile = "{}_sigtime.txt".format(input_file.split(".")[0])
-        if not os.path.exists(sigfile):
-            mh_t = time.clock()
-            storeSignatures(input_file, sigfile, hashes, bbox, k)
-            mh_time = time.clock() - mh_t
-            with open(sigtimefile, "w") as fout:
-                fout.write(repr(mh_time))
+        if vectorized:
+            tc_IDs, signatures = lsh.suiteMinhashing(test_suite.items(),
+                                                     hashes)
         else:
-            with open(sigtimefile, "r") as fin:
-                mh_time = eval(fin.read().replace("\n", ""))
-
-        ptime_start = time.clock()
-        tcs_minhashes, load_time = loadSignatures(sigfile)
-
-    tcs = set(tcs_minhashes.keys())
-
-    # budget B modification
-    if B == 0:
-        B = len(tcs)
-
-    BASE = 0.5
-    SIZE = int(len(tcs)*BASE) + 1
-
-    bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-
-    prioritized_tcs = [0]
-
-    # First TC
-
-    selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-    first_tc = random.choice(list(tcs_minhashes.keys()))
-    for i in range(n):
-        if tcs_minhashes[first_tc][i] < selected_tcs_minhash[i]:
-            selected_tcs_minhash[i] = tcs_minhashes[first_tc][i]
-    prioritized_tcs.append(first_tc)
-    tcs -= set([first_tc])
-    del tcs_minhashes[first_tc]
-
-    iteration, total = 0, float(len(tcs_minhashes))
-    while len(tcs_minhashes) > 0:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(tcs_minhashes) < SIZE:
-            bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-            SIZE = int(SIZE*BASE) + 1
-
-        sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                     b, r, n)
-        filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-        candidates = tcs - filtered_sim_cand
-
-        if len(candidates) == 0:
-            selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-            sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                         b, r, n)
-            filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-            candidates = tcs - filtered_sim_cand
-            if len(candidates) == 0:
-                candidates = tcs_minhashes.keys()
-
-        selected_tc, max_dist = random.choice(tuple(candidates)), -1
-        for candidate in tcs_minhashes:
-            if candidate in candidates:
-                dist = lsh.jDistanceEstimate(
-                    selected_tcs_minhash, tcs_minhashes[candidate])
-                if dist > max_dist:
-                    selected_tc, max_dist = candidate, dist
-
-        for i in range(n):
-            if tcs_minhashes[selected_tc][i] < selected_tcs_minhash[i]:
-                selected_tcs_minhash[i] = tcs_minhashes[selected_tc][i]
-
-        prioritized_tcs.append(selected_tc)
-
-        # select budget B
-        if len(prioritized_tcs) >= B+1:
-            break
+            tc_IDs, signatures = [], []
+            for chunk_IDs, chunk in legacyMinhashing(test_suite.items(),
+                                                     hashes):
+                tc_IDs.extend(chunk_IDs)
+                signatures.append(chunk)
+            signatures = np.concatenate(signatures)
+        mh_time = time.clock() - mh_t
+        return mh_time, tc_IDs, signatures
 
-        tcs -= set([selected_tc])
-        del tcs_minhashes[selected_tc]
+    # loading input file and generating minhashes signatures (cached)
+    def build(sigfile):
+        storeSignatures(input_file, sigfile, hashes, r, b, bbox, k,
+                        vectorized, oph, processes)
 
-    ptime = time.clock() - ptime_start
+    engine = "oph" if oph else ("minhash" if vectorized else "reference")
+    params = {"r": r, "b": b, "k": k, "bbox": bbox, "engine": engine,
+              "version": sigstore.VERSION}
+    sigfile, mh_time = cache.cached(input_file, "signatures", params, ".sig",
+                                    build)
 
-    max_ts_size = sum((1 for line in open(input_file)))
-    return mh_time, ptime, prioritized_tcs[1:max_ts_size]
+    tc_IDs, signatures = loadSignatures(sigfile)
+    return mh_time, tc_IDs, signatures
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# FAST selection engine (shared by FAST-pw and FAST-f, Budget and Adequate)
+
+class FASTSelection:
+    """State of a FAST selection over the rows of a signature matrix.
+    The remaining test cases are kept in a compact set (sampling.CompactSet),
+    the selected ones in a preallocated array, and the LSH index is keyed by
+    row: no per-iteration set of test cases is built.
+    One permutation hashing signatures are given undensified: the union is
+    merged on them and densified to be compared, as the indexed signatures.
+
+    INPUT
+    (list)tc_IDs: IDs of the test cases (one per row of signatures)
+    (np.array)signatures: uint64 matrix of signatures
+    (int)r, b: number of rows and bands
+    (int)probes: number of rows dropped per band by multi-probe, each one
+    adding b slots to the index (see lsh.LSHIndex)
+    (bool)oph: signatures are undensified one permutation hashing ones"""
+
+    def __init__(self, tc_IDs, signatures, r, b, probes=0, oph=False):
+        self.tc_IDs = np.asarray(tc_IDs, dtype=np.int64)
+        # signatures merged into the union, and signatures compared/indexed
+        self.merged = np.asarray(signatures)
+        self.densify = lsh.densification(r * b) if oph else None
+        self.signatures = (self.merged if self.densify is None
+                           else self.densify(self.merged))
+        N = len(self.tc_IDs)
+        # key=tcID, val=row
+        self.rows = dict(zip(self.tc_IDs.tolist(), range(N)))
+
+        self.remaining = sampling.CompactSet(range(N))
+        # mask of the remaining rows (np.flatnonzero lists them in order)
+        self.isRemaining = np.ones(N, dtype=bool)
+        self.selected = np.empty(N, dtype=np.int64)
+        self.count = 0
+
+        # signature of the union of the selected test cases (and its merged
+        # form)
+        self.mergedUnion = lsh.emptySignature(r * b)
+        self.union = self.mergedUnion
+        self.index = lsh.LSHIndex(b, r, probes=probes)
+        if N > 0:
+            self.index.insertMany(range(N), self.signatures)
+
+    def __len__(self):
+        return len(self.remaining)
+
+    def remove(self, row):
+        if row in self.remaining:
+            self.remaining.remove(row)
+            self.isRemaining[row] = False
+            self.index.remove(row)
+
+    def select(self, row):
+        self.selected[self.count] = row
+        self.count += 1
+        np.minimum(self.mergedUnion, self.merged[row], out=self.mergedUnion)
+        if self.densify is not None:
+            self.union = self.densify(self.mergedUnion)
+        self.remove(row)
+
+    # remaining rows not similar to the selected test cases (sorted)
+    def candidates(self):
+        for attempt in range(2):
+            # the index holds only remaining rows
+            similar = self.index.query(self.union)
+            self.isRemaining[similar] = False
+            candidates = np.flatnonzero(self.isRemaining)
+            self.isRemaining[similar] = True
+            if len(candidates) > 0:
+                return candidates
+            # all remaining are similar: restart from the empty union
+            self.mergedUnion = lsh.emptySignature(len(self.union))
+            self.union = self.mergedUnion
+        return np.flatnonzero(self.isRemaining)
+
+    # select rows (up to budget B) and drop those made useless by adequacy
+    def pick(self, rows, B, adequacy=None):
+        picked = []
+        for row in rows:
+            if self.count >= B:
+                break
+            self.select(row)
+            picked.append(row)
+        if adequacy is not None:
+            for row in picked:
+                for tc_ID in adequacy.cover(int(self.tc_IDs[row])):
+                    self.remove(self.rows[tc_ID])
+
+    def run(self, policy, B=0, adequacy=None):
+        """INPUT
+        (fun)policy: (state, sorted candidate rows) -> rows to select
+        (int)B: budget (0 = no budget)
+        (object)adequacy: stop criterion (e.g. coverage.CoverageIndex) with
+        methods adequate() and cover(tcID) -> tcIDs that became useless
+        (None = no adequacy)
+
+        OUTPUT
+        (list)selected: tcIDs in order of selection"""
+        if B <= 0:
+            B = len(self.tc_IDs)
+
+        # First TC
+        if len(self) > 0:
+            self.pick([self.remaining.choice()], B, adequacy)
+
+        iteration, total = 0, float(len(self))
+        while len(self) > 0 and self.count < B:
+            if adequacy is not None and adequacy.adequate():
+                break
+            iteration += 1
+            if iteration % 100 == 0:
+                sys.stdout.write("  Progress: {}%\r".format(
+                    round(100*iteration/total, 2)))
+                sys.stdout.flush()
 
-# FAST-f (for any input function f, i.e., size of candidate set)
-def fast_(input_file, selsize, r, b, bbox=False, k=5, memory=False, B=0):
-    n = r * b  # number of hash functions
-
-    hashes = [lsh.hashFamily(i) for i in range(n)]
+            self.pick(policy(self, self.candidates()), B, adequacy)
 
-    if memory:
-        test_suite = loadTestSuite(input_file, bbox=bbox, k=k)
-        # generate minhashes signatures
-        mh_t = time.clock()
-        tcs_minhashes = {tc[0]: lsh.tcMinhashing(tc, hashes)
-                         for tc in test_suite.items()}
-        mh_time = time.clock() - mh_t
-        ptime_start = time.clock()
+        return self.tc_IDs[self.selected[:self.count]].tolist()
 
-    else:
-        # loading input file and generating minhashes signatures
-        sigfile = input_file.replace(".txt", ".sig")
-        sigtimefile = "{}_sigtime.txt".format(input_file.split(".")[0])
-        if not os.path.exists(sigfile):
-            mh_t = time.clock()
-            storeSignatures(input_file, sigfile, hashes, bbox, k)
-            mh_time = time.clock() - mh_t
-            with open(sigtimefile, "w") as fout:
-                fout.write(repr(mh_time))
-        else:
-            with open(sigtimefile, "r") as fin:
-                mh_time = eval(fin.read().replace("\n", ""))
-
-        ptime_start = time.clock()
-        tcs_minhashes, load_time = loadSignatures(sigfile)
-
-    tcs = set(tcs_minhashes.keys())
-
-    # budget B modification
-    if B == 0:
-        B = len(tcs)
-
-    BASE = 0.5
-    SIZE = int(len(tcs)*BASE) + 1
-
-    bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-
-    prioritized_tcs = [0]
-
-    # First TC
-
-    selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-    first_tc = random.choice(list(tcs_minhashes.keys()))
-    for i in range(n):
-        if tcs_minhashes[first_tc][i] < selected_tcs_minhash[i]:
-            selected_tcs_minhash[i] = tcs_minhashes[first_tc][i]
-    prioritized_tcs.append(first_tc)
-    tcs -= set([first_tc])
-    del tcs_minhashes[first_tc]
-
-    iteration, total = 0, float(len(tcs_minhashes))
-    while len(tcs_minhashes) > 0:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(tcs_minhashes) < SIZE:
-            bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-            SIZE = int(SIZE*BASE) + 1
-
-        sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                     b, r, n)
-        filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-        candidates = tcs - filtered_sim_cand
-
-        if len(candidates) == 0:
-            selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-            sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                         b, r, n)
-            filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-            candidates = tcs - filtered_sim_cand
-            if len(candidates) == 0:
-                candidates = tcs_minhashes.keys()
+# FAST-pw policy: the candidate farthest from the selected test cases
+def pairwise(state, candidates):
+    row, max_dist = lsh.farthestSignature(state.union, state.signatures,
+                                          candidates)
+    return [row]
 
+# FAST-f policy: selsize(#candidates) random candidates
+def subsampling(selsize):
+    def policy(state, candidates):
         to_sel = min(selsize(len(candidates)), len(candidates))
-        selected_tc_set = random.sample(tuple(candidates), to_sel)
+        return random.sample(candidates.tolist(), to_sel)
 
-        for selected_tc in selected_tc_set:
-            for i in range(n):
-                if tcs_minhashes[selected_tc][i] < selected_tcs_minhash[i]:
-                    selected_tcs_minhash[i] = tcs_minhashes[selected_tc][i]
+    return policy
 
-            prioritized_tcs.append(selected_tc)
 
-            # select budget B
-            if len(prioritized_tcs) >= B+1:
-                break
-
-            tcs -= set([selected_tc])
-            del tcs_minhashes[selected_tc]
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-        # select budget B
-        if len(prioritized_tcs) >= B+1:
-            break
 
+# FAST-PW (pairwise comparison with candidate set)
+def fast_pw(input_file, r, b, bbox=False, k=5, memory=False, B=0,
+            vectorized=True, oph=False, probes=0):
+    mh_time, tc_IDs, signatures = minhashSignatures(
+        input_file, r, b, bbox, k, memory, vectorized, oph)
+
+    ptime_start = time.clock()
+    selection = FASTSelection(tc_IDs, signatures, r, b, probes, oph)
+    prioritized_tcs = selection.run(pairwise, B=B)
     ptime = time.clock() - ptime_start
 
-    max_ts_size = sum((1 for line in open(input_file)))
-    return mh_time, ptime, prioritized_tcs[1:max_ts_size]
+    return mh_time, ptime, prioritized_tcs
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-# Preparation + utils
 
-# compute euclidean distance
-def euclideanDist(v, w):
-    d = 0
+# FAST-f (for any input function f, i.e., size of candidate set)
+def fast_(input_file, selsize, r, b, bbox=False, k=5, memory=False, B=0,
+          vectorized=True, oph=False, probes=0):
+    mh_time, tc_IDs, signatures = minhashSignatures(
+        input_file, r, b, bbox, k, memory, vectorized, oph)
+
+    ptime_start = time.clock()
+    selection = FASTSelection(tc_IDs, signatures, r, b, probes, oph)
+    prioritized_tcs = selection.run(subsampling(selsize), B=B)
+    ptime = time.clock() - ptime_start
 
-    for k in v.keys():
-        if k not in w.keys():
-            d += v[k] ** 2
-        else:
-            d += (v[k] - w[k]) ** 2
+    return mh_time, ptime, prioritized_tcs
 
-    for k in w.keys():
-        if k not in v.keys():
-            d += w[k] ** 2
 
-    return math.sqrt(d)
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Preparation + utils
 
-# Preparation phase for FAST++ and FAST-CS
-def preparation(inputFile, dim=0):
+# random projection of the test suite (scipy sparse matrix, one row per tc)
+def projection(inputFile, dim=0):
     vectorizer = HashingVectorizer()  # compute "TF"
-    testCases = [line.rstrip("\n") for line in open(inputFile)]
-    testSuite = vectorizer.fit_transform(testCases)
+    testSuite = vectorizer.fit_transform(loader.readLines(inputFile))
 
     # dimensionality reduction
     if dim <= 0:
         e = 0.5  # epsilon in jl lemma
-        dim = johnson_lindenstrauss_min_dim(len(testCases), eps=e)
+        dim = int(johnson_lindenstrauss_min_dim(testSuite.shape[0], eps=e))
     srp = SparseRandomProjection(n_components=dim)
-    projectedTestSuite = srp.fit_transform(testSuite)
+    return srp.fit_transform(testSuite)
 
-    # map sparse matrix to dict
-    TS = []
-    for i in range(len(testCases)):
-        tc = {}
-        for j in projectedTestSuite[i].nonzero()[1]:
-            tc[j] = projectedTestSuite[i, j]
-        TS.append(tc)
+# Preparation phase for FAST++ and FAST-CS
+# Returns: the projected test suite as a contiguous float32 matrix
+def preparation(inputFile, dim=0):
+    projectedTestSuite = projection(inputFile, dim=dim)
+    return np.ascontiguousarray(projectedTestSuite.toarray(),
+                                dtype=np.float32)
+
+# Preparation phase streamed in chunks of lines: each chunk is vectorized and
+# projected (the projection is seeded and fitted on the shape only, so it is
+# the same for all chunks) and appended to the float32 matrix in outFile
+# (seed=None: random seed drawn once per call)
+# Returns: the projected test suite memory-mapped from outFile (.npy)
+def streamingPreparation(inputFile, outFile, dim=0, chunk=10000, seed=None):
+    if seed is None:
+        seed = random.randrange(2**31)
+    numOfTCS = loader.countTestCases(inputFile)
+    vectorizer = HashingVectorizer()  # compute "TF" (stateless)
 
-    return TS
+    # dimensionality reduction
+    if dim <= 0:
+        e = 0.5  # epsilon in jl lemma
+        dim = int(johnson_lindenstrauss_min_dim(numOfTCS, eps=e))
+    srp = SparseRandomProjection(n_components=dim, random_state=seed)
+    srp.fit(scipy.sparse.csr_matrix((1, vectorizer.n_features)))
+
+    tmpFile = "{}.{}.tmp".format(outFile, os.getpid())
+    TS = np.lib.format.open_memmap(tmpFile, mode="w+", dtype=np.float32,
+                                   shape=(numOfTCS, dim))
+    lines, row = loader.readLines(inputFile), 0
+    for testCases in iter(lambda: list(itertools.islice(lines, chunk)), []):
+        projected = srp.transform(vectorizer.transform(testCases))
+        if scipy.sparse.issparse(projected):
+            projected = projected.toarray()
+        TS[row:row + len(testCases)] = projected
+        row += len(testCases)
+    TS.flush()
+    del TS
+    # atomic rename: concurrent readers never see a partial matrix
+    os.replace(tmpFile, outFile)
+
+    return np.load(outFile, mmap_mode="r")
+
+# projected test suite: computed in memory, or streamed to disk once and
+# memory-mapped afterwards (memory=False, see cache)
+# Returns: preparation time, projected test suite
+def prepareTestSuite(inputFile, dim=0, memory=True):
+    if memory:
+        t0 = time.clock()
+        TS = preparation(inputFile, dim=dim)
+        t1 = time.clock()
+        return t1-t0, TS
+
+    # streamed to disk once (cached)
+    def build(rpFile):
+        streamingPreparation(inputFile, rpFile, dim=dim)
+
+    rpFile, pTime = cache.cached(inputFile, "projection", {"dim": dim}, ".npy",
+                                 build)
+    return pTime, np.load(rpFile, mmap_mode="r")
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-# FAST++ Reduction phase
-def reductionPlusPlus(TS, B):
+# FAST++ Reduction phase on the projected test suite (float32 matrix X)
+def reductionPlusPlus(X, B):
+    N = len(X)
     reducedTS = []
 
-    # distance to closest center
-    D = defaultdict(lambda:float('Inf'))
+    # squared distance to closest center
+    D = np.full(N, np.inf)
     # select first center randomly
-    selectedTC = random.randint(0, len(TS)-1)
+    selectedTC = random.randint(0, N-1)
     reducedTS.append(selectedTC + 1)
     D[selectedTC] = 0
 
     while len(reducedTS) < B:
-        # k-means++ tc reductionCS
-        norm = 0
-        for tc in range(len(TS)):
-            if D[tc] != 0:
-                dist = euclideanDist(TS[tc], TS[selectedTC])
-                dist *= dist
-                if dist < D[tc]:
-                    D[tc] = dist
-            norm += D[tc]
+        # k-means++ tc selection: one vectorized update per center
+        diff = X - X[selectedTC]
+        np.minimum(D, np.einsum("ij,ij->i", diff, diff), out=D)
+        cumD = np.cumsum(D)
+        norm = cumD[-1]
 
         # safe exit point (if all distances are 0)
         # (but not all test cases have been selected)
         if norm == 0:
-            extraTCS = list(set(range(1, len(TS)+1)) - set(reducedTS))
+            extraTCS = list(set(range(1, N+1)) - set(reducedTS))
             random.shuffle(extraTCS)
             reducedTS.extend(extraTCS[:B-len(reducedTS)])
             break
 
-
-        c = 0
+        # first tc whose cumulative distance exceeds the coin toss
         coinToss = random.random() * norm
-        for tc, dist in D.items():
-            if coinToss < c + dist:
-                reducedTS.append(tc + 1)
-                D[tc] = 0
+        selectedTC = min(int(np.searchsorted(cumD, coinToss, side="right")),
+                         N-1)
+        reducedTS.append(selectedTC + 1)
+        D[selectedTC] = 0
+
+    return reducedTS
+
+# relative tolerance of the pruning test (float32 rounding of distances)
+PRUNING_MARGIN = 1e-4
+
+# FAST++ Reduction phase on the dense projection with triangle inequality
+# pruning: if the new center c is at distance >= 2*d(tc, a) from the center a
+# closest to tc, then d(tc, c) >= d(tc, a) and D[tc] cannot change.
+# Centers are drawn from a sum tree of D (see sampling.SumTree) updated only
+# at the changed distances: same selections as reductionPlusPlus (same random
+# sequence), up to the rounding of the cumulative sums.
+def reductionPlusPlusPruned(X, B):
+    N = len(X)
+    reducedTS = []
+
+    # select first center randomly
+    selectedTC = random.randint(0, N-1)
+    reducedTS.append(selectedTC + 1)
+    diff = X - X[selectedTC]
+    # squared distance (and distance) to closest center
+    D = np.einsum("ij,ij->i", diff, diff).astype(np.float64)
+    D[selectedTC] = 0
+    R = np.sqrt(D)
+
+    # closest center of each tc (index in centers)
+    assigned = np.zeros(N, dtype=np.int64)
+    centers = np.empty(max(B, 1), dtype=np.int64)
+    centers[0], k = selectedTC, 1
+    # scratch array indexed by center (live centers, see below)
+    slot = np.empty(max(B, 1), dtype=np.int64)
+    # tcs with D > 0 (the only ones that can be sampled or updated)
+    live = np.nonzero(D > 0)[0]
+    # sampling weights: only the updated distances are written to the tree
+    tree = sampling.SumTree(D)
+
+    while len(reducedTS) < B:
+        # safe exit point (if all distances are 0)
+        # (but not all test cases have been selected)
+        if tree.total() == 0:
+            extraTCS = list(set(range(1, N+1)) - set(reducedTS))
+            random.shuffle(extraTCS)
+            reducedTS.extend(extraTCS[:B-len(reducedTS)])
+            break
+
+        # first tc whose cumulative distance exceeds the coin toss
+        selectedTC = tree.sample(random.random())
+        reducedTS.append(selectedTC + 1)
+        if len(reducedTS) == B:
+            break
+
+        # distances from the new center to the centers of live tcs
+        x = X[selectedTC]
+        # (as np.unique(assigned[live], return_inverse=True) in O(#live):
+        # slot[c] first holds some live tc of center c, which picks one per
+        # center, then the index of c among the live centers)
+        liveAssigned = assigned[live]
+        slot[liveAssigned] = np.arange(len(live))
+        liveCenters = liveAssigned[slot[liveAssigned] == np.arange(len(live))]
+        slot[liveCenters] = np.arange(len(liveCenters))
+        inverse = slot[liveAssigned]
+        diff = X[centers[liveCenters]] - x
+        dc = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+        # update only the tcs whose D may decrease
+        near = live[dc[inverse] * (1 - PRUNING_MARGIN) < 2 * R[live]]
+        diff = X[near] - x
+        dist = np.einsum("ij,ij->i", diff, diff)
+        closer = dist < D[near]
+        near = near[closer]
+        D[near] = dist[closer]
+        R[near] = np.sqrt(D[near])
+        assigned[near] = k
+
+        D[selectedTC], R[selectedTC] = 0, 0
+        changed = np.append(near, selectedTC)
+        tree.update(changed, D[changed])
+        centers[k], k = selectedTC, k + 1
+        live = live[D[live] > 0]
+
+    return reducedTS
+
+# projected test suite shared with the k-means|| workers (set by initWorker)
+_X = None
+
+def initWorker(X):
+    global _X
+    _X = X
+
+# squared distance of rows [lo, hi) to their closest center (and its index)
+def closestCenters(task, block=1024):
+    lo, hi, centers = task
+    chunk = _X[lo:hi].astype(np.float64)
+    chunkNorms = np.einsum("ij,ij->i", chunk, chunk)
+    D = np.full(hi - lo, np.inf)
+    assigned = np.zeros(hi - lo, dtype=np.int64)
+    for first in range(0, len(centers), block):
+        C = _X[centers[first:first + block]].astype(np.float64)
+        dist = (chunkNorms[:, None] - 2 * chunk.dot(C.T) +
+                np.einsum("ij,ij->i", C, C)[None, :])
+        closest = np.argmin(dist, axis=1)
+        dist = np.maximum(dist[np.arange(hi - lo), closest], 0)
+        closer = dist < D
+        D[closer] = dist[closer]
+        assigned[closer] = closest[closer] + first
+    return D, assigned
+
+# weighted k-means++ seeding of B centers among the rows of X
+def weightedPlusPlus(X, w, B):
+    N = len(X)
+    selected = []
+    D = np.full(N, np.inf)
+    cumW = np.cumsum(w)
+    selectedTC = min(int(np.searchsorted(cumW, random.random() * cumW[-1],
+                                         side="right")), N-1)
+    selected.append(selectedTC)
+    D[selectedTC] = 0
+
+    while len(selected) < min(B, N):
+        diff = X[selectedTC] - X
+        np.minimum(D, np.einsum("ij,ij->i", diff, diff), out=D)
+        cumD = np.cumsum(w * D)
+        if cumD[-1] == 0:
+            break
+        coinToss = random.random() * cumD[-1]
+        selectedTC = min(int(np.searchsorted(cumD, coinToss, side="right")),
+                         N-1)
+        selected.append(selectedTC)
+        D[selectedTC] = 0
+
+    return selected
+
+# FAST++ Reduction phase with scalable k-means++ (k-means||): few rounds over
+# the suite (in parallel), each sampling many centers with probability
+# proportional to D, then reduction of the weighted centers to B
+def reductionPlusPlusParallel(X, B, rounds=0, oversampling=0, processes=None,
+                              chunk=2**14):
+    """INPUT
+    (np.array)X: dense projection of the test suite (N x dim)
+    (int)B: budget
+    (int)rounds: number of sampling rounds (default: log2(B) + 1)
+    (float)oversampling: expected centers per round (default: 2B / rounds)
+    (int)processes: number of worker processes (default: cpu count)
+    (int)chunk: rows per task
+
+    OUTPUT
+    (list)reducedTS: B tcIDs"""
+    N = len(X)
+    B = min(B, N)
+    if rounds <= 0:
+        rounds = int(math.log(max(B, 1), 2)) + 1
+    if oversampling <= 0:
+        oversampling = 2.0 * B / rounds
+
+    # first center uniformly at random, every tc is assigned to it
+    centers = [random.randint(0, N-1)]
+    diff = X - X[centers[0]]
+    D = np.einsum("ij,ij->i", diff, diff).astype(np.float64)
+    assigned = np.zeros(N, dtype=np.int64)
+
+    context = multiprocessing.get_context("fork")
+    with context.Pool(processes, initializer=initWorker,
+                      initargs=(X,)) as pool:
+        r = 0
+        while r < rounds or len(centers) < B:
+            norm = D.sum()
+            if norm == 0:
                 break
-            c += dist
+            P = np.minimum(1.0, oversampling * D / norm)
+            new = np.nonzero(np.random.random(N) < P)[0]
+            if len(new) == 0:
+                continue
+
+            tasks = [(lo, min(lo + chunk, N), new)
+                     for lo in range(0, N, chunk)]
+            for lo, (dist, closest) in zip(range(0, N, chunk),
+                                           pool.imap(closestCenters, tasks)):
+                closer = dist < D[lo:lo + len(dist)]
+                rows = np.nonzero(closer)[0] + lo
+                D[rows] = dist[closer]
+                assigned[rows] = closest[closer] + len(centers)
+            D[new] = 0
+            assigned[new] = np.arange(len(centers), len(centers) + len(new))
+            centers.extend(new.tolist())
+            r += 1
+
+    # weight of a center: number of tcs closest to it
+    centers = np.array(centers)
+    weights = np.bincount(assigned, minlength=len(centers)).astype(np.float64)
+    selected = weightedPlusPlus(X[centers], weights, B)
+    reducedTS = [int(centers[i]) + 1 for i in selected]
+
+    # safe exit point (if all distances are 0)
+    # (but not all test cases have been selected)
+    if len(reducedTS) < B:
+        extraTCS = list(set(range(1, N+1)) - set(reducedTS))
+        random.shuffle(extraTCS)
+        reducedTS.extend(extraTCS[:B-len(reducedTS)])
 
     return reducedTS
 
 # FAST++ test suite reduction algorithm
 # Returns: preparation time, reduction time, reduced test suite
-def fastPlusPlus(inputFile, dim=0, B=0, memory=True):
-    if memory:
-        t0 = time.clock()
-        TS = preparation(inputFile, dim=dim)
-        t1 = time.clock()
-        pTime = t1-t0
-    else:
-        rpFile = inputFile.replace(".txt", ".rp")
-        if not os.path.exists(rpFile):
-            t0 = time.clock()
-            TS = preparation(inputFile, dim=dim)
-            t1 = time.clock()
-            pTime = t1-t0
-            pickle.dump((pTime, TS), open(rpFile, "wb"))
-        else:
-            pTime, TS = pickle.load(open(rpFile, "rb"))
+# mode: "sequential" (see reductionPlusPlus), "pruned" (with triangle
+# inequality pruning) or "parallel" (k-means||, see reductionPlusPlusParallel)
+def fastPlusPlus(inputFile, dim=0, B=0, memory=True, mode="sequential"):
+    pTime, TS = prepareTestSuite(inputFile, dim=dim, memory=memory)
 
     if B <= 0:
         B = len(TS)
 
-    t2 = time.clock()
-    reducedTS = reductionPlusPlus(TS, B)
-    t3 = time.clock()
+    # wall-clock time for the parallel mode (it runs in the Pool workers)
+    timer = time.perf_counter if mode == "parallel" else time.clock
+    t2 = timer()
+    if mode == "pruned":
+        reducedTS = reductionPlusPlusPruned(TS, B)
+    elif mode == "parallel":
+        reducedTS = reductionPlusPlusParallel(TS, B)
+    else:
+        reducedTS = reductionPlusPlus(TS, B)
+    t3 = timer()
     sTime = t3-t2
 
     return pTime, sTime, reducedTS
@@ -436,62 +690,28 @@ def fastPlusPlus(inputFile, dim=0, B=0, memory=True):
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # FAST-CS
 
-# FAST-CS Reduction phase
-def reductionCS(TS, B):
-    reducedTS = []
+# FAST-CS Reduction phase on the projected test suite (float32 matrix X)
+def reductionCS(X, B):
+    N = len(X)
 
-    # compute center of mass
-    centerOfMass = defaultdict(float)
-    for tc in TS:
-        for k, v in tc.items():
-            centerOfMass[k] += v
-    # normalize
-    for k in centerOfMass.keys():
-        centerOfMass[k] /= len(TS)
-
-    # compute distances
-    D = defaultdict(float)
-    norm = 0
-    for tc in range(len(TS)):
-        dist = euclideanDist(TS[tc], centerOfMass)
-        D[tc] = dist*dist
-        norm += D[tc]
+    # compute center of mass and distances
+    diff = X - X.mean(axis=0, dtype=np.float64)
+    D = np.einsum("ij,ij->i", diff, diff)
+    norm = D.sum()
 
     # compute probabilities of being sampled
-    P = []
     if norm != 0:
-        p = 1.0 / (2*len(TS))
-        for tc in range(len(TS)):
-            P.append(p + D[tc] / (2*norm))
+        P = 1.0 / (2*N) + D / (2*norm)
     else:
-        P = [1.0 / len(TS)] * len(TS)
-
-    # numeric error: when sum of P != 1
-    P[random.randint(0, len(TS)-1)] += 1.0 - sum(P)
+        P = np.full(N, 1.0 / N)
 
     # proportional sampling
-    reducedTS = list(np.random.choice(list(range(1, len(TS)+1)), size=B, p=P, replace=False))
-
-    return reducedTS
+    return (sampling.weightedSample(P, B) + 1).tolist()
 
 # FAST-CS test suite reduction algorithm
 # Returns: preparation time, reduction time, reduced test suite
 def fastCS(inputFile, dim=0, B=0, memory=True):
-    if memory:
-        t0 = time.clock()
-        TS = preparation(inputFile, dim=dim)
-        t1 = time.clock()
-        pTime = t1-t0
-    else:
-        rpFile = inputFile.replace(".txt", ".rp")
-        if not os.path.exists(rpFile):
-            t0 = time.clock()
-            TS = preparation(inputFile, dim=dim)
-            t1 = time.clock()
-            pTime = t1-t0
-            pickle.dump((pTime, TS), open(rpFile, "wb"))
-        else:
-            pTime, TS = pickle.load(open(rpFile, "rb"))
+    pTime, TS = prepareTestSuite(inputFile, dim=dim, memory=memory)
 
     if B <= 0:
         B = len(TS)
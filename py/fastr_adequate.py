@@ -13,479 +13,143 @@ You should have received a copy of the GNU General Public License
 along with this source.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-from collections import defaultdict
-from collections import OrderedDict
 import math
-import os
 import random
-import sys
 import time
 
-from functools import reduce
 import numpy as np
 
-from sklearn.feature_extraction.text import HashingVectorizer
-from sklearn.random_projection import johnson_lindenstrauss_min_dim
-from sklearn.random_projection import SparseRandomProjection
-
-import lsh
+import coverage
+import fastr
+import loader
+import sampling
 
 
 """
 This file implements FAST-R test suite reduction algorithms for the Adequate scenario.
 """
 
-# utility function to load test suite
-def loadTestSuite(input_file, bbox=False, k=5):
-    TS = defaultdict()
-    with open(input_file) as fin:
-        tcID = 1
-        for tc in fin:
-            if bbox:
-                TS[tcID] = tc[:-1]
-            else:
-                TS[tcID] = set(tc[:-1].split())
-            tcID += 1
-    shuffled = list(TS.keys())
-    random.shuffle(shuffled)
-    newTS = OrderedDict()
-    for key in shuffled:
-        newTS[key] = TS[key]
-    if bbox:
-        newTS = lsh.kShingles(TS, k)
-    return newTS
-
-# store signatures on disk for future re-use
-def storeSignatures(input_file, sigfile, hashes, bbox=False, k=5):
-    with open(sigfile, "w") as sigfile:
-        with open(input_file) as fin:
-            tcID = 1
-            for tc in fin:
-                if bbox:
-                    # shingling
-                    tc_ = tc[:-1]
-                    tc_shingles = set()
-                    for i in range(len(tc_) - k + 1):
-                        tc_shingles.add(hash(tc_[i:i + k]))
-
-                    sig = lsh.tcMinhashing((tcID, set(tc_shingles)), hashes)
-                else:
-                    tc_ = tc[:-1].split()
-                    sig = lsh.tcMinhashing((tcID, set(tc_)), hashes)
-                for hash_ in sig:
-                    sigfile.write(hash_)
-                    sigfile.write(" ")
-                sigfile.write("\n")
-                tcID += 1
-
-# load stored signatures
-def loadSignatures(input_file):
-    sig = {}
-    start = time.clock()
-    with open(input_file, "r") as fin:
-        tcID = 1
-        for tc in fin:
-            sig[tcID] = [i.strip() for i in tc[:-1].split()]
-            tcID += 1
-    return sig, time.clock() - start
-
-
-def loadCoverage(wBoxFile):
-    C = defaultdict(set)
-    with open(wBoxFile) as fin:
-        for tc, cov in enumerate(fin):
-            C[tc+1] = set(cov.split())
-    return C
-
-
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 
 # FAST-PW (pairwise comparison with candidate set)
-def fast_pw(input_file, wBoxFile, r, b, bbox=False, k=5, memory=False):
-    n = r * b  # number of hash functions
-
+def fast_pw(input_file, wBoxFile, r, b, bbox=False, k=5, memory=False,
+            vectorized=True, oph=False, probes=0):
     tC0 = time.clock()
-    C = loadCoverage(wBoxFile)
+    C = loader.loadCoverage(wBoxFile)
     tC1 = time.clock()
-    maxCov = reduce(lambda x, y: x | y, C.values())
-
-    hashes = [lsh.hashFamily(i) for i in range(n)]
-
-    if memory:
-        test_suite = loadTestSuite(input_file, bbox=bbox, k=k)
-        # generate minhashes signatures
-        mh_t = time.clock()
-        tcs_minhashes = {tc[0]: lsh.tcMinhashing(tc, hashes)
-                         for tc in test_suite.items()}
-        mh_time = time.clock() - mh_t
-        ptime_start = time.clock()
-
-    else:
-        # loading input file and generating minhashes signatures
-        sigfile = input_file.replace(".txt", ".sig")
-        sigtimefile = "{}_sigtime.txt".format(input_file.split(".")[0])
-        if not os.path.exists(sigfile):
-            mh_t = time.clock()
-            storeSignatures(input_file, sigfile, hashes, bbox, k)
-            mh_time = time.clock() - mh_t
-            with open(sigtimefile, "w") as fout:
-                fout.write(repr(mh_time))
-        else:
-            with open(sigtimefile, "r") as fin:
-                mh_time = eval(fin.read().replace("\n", ""))
-
-        ptime_start = time.clock()
-        tcs_minhashes, load_time = loadSignatures(sigfile)
-
-    tcs = set(tcs_minhashes.keys())
-
-    BASE = 0.5
-    SIZE = int(len(tcs)*BASE) + 1
-
-    bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-
-    prioritized_tcs = [0]
-
-    # First TC
-
-    selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-    first_tc = random.choice(list(tcs_minhashes.keys()))
-
-    for i in range(n):
-        if tcs_minhashes[first_tc][i] < selected_tcs_minhash[i]:
-            selected_tcs_minhash[i] = tcs_minhashes[first_tc][i]
-    prioritized_tcs.append(first_tc)
-
-    cov = C[first_tc]
-    for tc in C.keys():
-        C[tc] = C[tc] - cov
-        if tc in tcs and len(C[tc]) == 0:
-            tcs -= set([tc])
-            del tcs_minhashes[tc]
-
-    iteration, total = 0, float(len(tcs_minhashes))
-    while cov != maxCov:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(tcs_minhashes) < SIZE:
-            bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-            SIZE = int(SIZE*BASE) + 1
-
-        sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                     b, r, n)
-        filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-        candidates = tcs - filtered_sim_cand
-
-        if len(candidates) == 0:
-            selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-            sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                         b, r, n)
-            filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-            candidates = tcs - filtered_sim_cand
-            if len(candidates) == 0:
-                candidates = tcs_minhashes.keys()
-
-        selected_tc, max_dist = random.choice(tuple(candidates)), -1
-        for candidate in tcs_minhashes:
-            if candidate in candidates:
-                dist = lsh.jDistanceEstimate(
-                    selected_tcs_minhash, tcs_minhashes[candidate])
-                if dist > max_dist:
-                    selected_tc, max_dist = candidate, dist
-
-        for i in range(n):
-            if tcs_minhashes[selected_tc][i] < selected_tcs_minhash[i]:
-                selected_tcs_minhash[i] = tcs_minhashes[selected_tc][i]
-
-        prioritized_tcs.append(selected_tc)
-
-        cov = cov | C[selected_tc]
-        for tc in C.keys():
-            C[tc] = C[tc] - cov
-            if tc in tcs and len(C[tc]) == 0:
-                tcs -= set([tc])
-                del tcs_minhashes[tc]
 
+    mh_time, tc_IDs, signatures = fastr.minhashSignatures(
+        input_file, r, b, bbox, k, memory, vectorized, oph)
+    # tests missing from the coverage file cover nothing
+    adequacy = coverage.CoverageIndex({tc: C.get(tc, set())
+                                       for tc in tc_IDs})
 
+    ptime_start = time.clock()
+    selection = fastr.FASTSelection(tc_IDs, signatures, r, b, probes, oph)
+    prioritized_tcs = selection.run(fastr.pairwise, adequacy=adequacy)
     ptime = time.clock() - ptime_start
 
-    max_ts_size = sum((1 for line in open(input_file)))
-    return mh_time, tC1-tC0, ptime, prioritized_tcs[1:max_ts_size]
+    return mh_time, tC1-tC0, ptime, prioritized_tcs
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 # FAST-f (for any input function f, i.e., size of candidate set)
-def fast_(input_file, wBoxFile, selsize, r, b, bbox=False, k=5, memory=False):
-    n = r * b  # number of hash functions
-
+def fast_(input_file, wBoxFile, selsize, r, b, bbox=False, k=5, memory=False,
+          vectorized=True, oph=False, probes=0):
     tC0 = time.clock()
-    C = loadCoverage(wBoxFile)
+    C = loader.loadCoverage(wBoxFile)
     tC1 = time.clock()
-    maxCov = reduce(lambda x, y: x | y, C.values())
-
-    hashes = [lsh.hashFamily(i) for i in range(n)]
-
-    if memory:
-        test_suite = loadTestSuite(input_file, bbox=bbox, k=k)
-        # generate minhashes signatures
-        mh_t = time.clock()
-        tcs_minhashes = {tc[0]: lsh.tcMinhashing(tc, hashes)
-                         for tc in test_suite.items()}
-        mh_time = time.clock() - mh_t
-        ptime_start = time.clock()
-
-    else:
-        # loading input file and generating minhashes signatures
-        sigfile = input_file.replace(".txt", ".sig")
-        sigtimefile = "{}_sigtime.txt".format(input_file.split(".")[0])
-        if not os.path.exists(sigfile):
-            mh_t = time.clock()
-            storeSignatures(input_file, sigfile, hashes, bbox, k)
-            mh_time = time.clock() - mh_t
-            with open(sigtimefile, "w") as fout:
-                fout.write(repr(mh_time))
-        else:
-            with open(sigtimefile, "r") as fin:
-                mh_time = eval(fin.read().replace("\n", ""))
-
-        ptime_start = time.clock()
-        tcs_minhashes, load_time = loadSignatures(sigfile)
-
-    tcs = set(tcs_minhashes.keys())
-
-    BASE = 0.5
-    SIZE = int(len(tcs)*BASE) + 1
-
-    bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-
-    prioritized_tcs = [0]
-
-    # First TC
-
-    selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-    first_tc = random.choice(list(tcs_minhashes.keys()))
-    for i in range(n):
-        if tcs_minhashes[first_tc][i] < selected_tcs_minhash[i]:
-            selected_tcs_minhash[i] = tcs_minhashes[first_tc][i]
-    prioritized_tcs.append(first_tc)
-
-    cov = C[first_tc]
-    for tc in C.keys():
-        C[tc] = C[tc] - cov
-        if tc in tcs and len(C[tc]) == 0:
-            tcs -= set([tc])
-            del tcs_minhashes[tc]
-
-    iteration, total = 0, float(len(tcs_minhashes))
-    while cov != maxCov:
-        iteration += 1
-        if iteration % 100 == 0:
-            sys.stdout.write("  Progress: {}%\r".format(
-                round(100*iteration/total, 2)))
-            sys.stdout.flush()
-
-        if len(tcs_minhashes) < SIZE:
-            bucket = lsh.LSHBucket(tcs_minhashes.items(), b, r, n)
-            SIZE = int(SIZE*BASE) + 1
-
-        sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                     b, r, n)
-        filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-        candidates = tcs - filtered_sim_cand
-
-        if len(candidates) == 0:
-            selected_tcs_minhash = lsh.tcMinhashing((0, set()), hashes)
-            sim_cand = lsh.LSHCandidates(bucket, (0, selected_tcs_minhash),
-                                         b, r, n)
-            filtered_sim_cand = sim_cand.difference(prioritized_tcs)
-            candidates = tcs - filtered_sim_cand
-            if len(candidates) == 0:
-                candidates = tcs_minhashes.keys()
-
-        to_sel = min(selsize(len(candidates)), len(candidates))
-        selected_tc_set = random.sample(tuple(candidates), to_sel)
-
-        for selected_tc in selected_tc_set:
-            for i in range(n):
-                if tcs_minhashes[selected_tc][i] < selected_tcs_minhash[i]:
-                    selected_tcs_minhash[i] = tcs_minhashes[selected_tc][i]
-            prioritized_tcs.append(selected_tc)
-            cov = cov | C[selected_tc]
-
-        for tc in C.keys():
-            C[tc] = C[tc] - cov
-            if tc in tcs and len(C[tc]) == 0:
-                tcs -= set([tc])
-                del tcs_minhashes[tc]
 
+    mh_time, tc_IDs, signatures = fastr.minhashSignatures(
+        input_file, r, b, bbox, k, memory, vectorized, oph)
+    # tests missing from the coverage file cover nothing
+    adequacy = coverage.CoverageIndex({tc: C.get(tc, set())
+                                       for tc in tc_IDs})
 
+    ptime_start = time.clock()
+    selection = fastr.FASTSelection(tc_IDs, signatures, r, b, probes, oph)
+    prioritized_tcs = selection.run(fastr.subsampling(selsize),
+                                    adequacy=adequacy)
     ptime = time.clock() - ptime_start
 
-    max_ts_size = sum((1 for line in open(input_file)))
-    return mh_time, tC1-tC0, ptime, prioritized_tcs[1:max_ts_size]
-
-
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-# Preparation + utils
-
-# load coverage (only for wbox usage)
-def loadCoverage(wBoxFile):
-    C = defaultdict(set)
-    with open(wBoxFile) as fin:
-        for tc, cov in enumerate(fin):
-            C[tc] = set(cov.split())
-    return C
-
-# compute euclidean distance
-def euclideanDist(v, w):
-    d = 0
-
-    for k in v.keys():
-        if k not in w.keys():
-            d += v[k] ** 2
-        else:
-            d += (v[k] - w[k]) ** 2
-
-    for k in w.keys():
-        if k not in v.keys():
-            d += w[k] ** 2
-
-    return math.sqrt(d)
-
-# Preparation phase for FAST++ and FAST-CS
-def preparation(inputFile, dim=0):
-    vectorizer = HashingVectorizer()  # compute "TF"
-    testCases = [line.rstrip("\n") for line in open(inputFile)]
-    testSuite = vectorizer.fit_transform(testCases)
-
-    # dimensionality reduction
-    if dim <= 0:
-        e = 0.5  # epsilon in jl lemma
-        dim = johnson_lindenstrauss_min_dim(len(testCases), eps=e)
-    srp = SparseRandomProjection(n_components=dim)
-    projectedTestSuite = srp.fit_transform(testSuite)
-
-    # map sparse matrix to dict
-    TS = []
-    for i in range(len(testCases)):
-        tc = {}
-        for j in projectedTestSuite[i].nonzero()[1]:
-            tc[j] = projectedTestSuite[i, j]
-        TS.append(tc)
-
-    return TS
+    return mh_time, tC1-tC0, ptime, prioritized_tcs
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # FAST++
 
-# FAST++ Reduction phase
-def reductionPlusPlus(TS, C, S):
+# FAST++ Reduction phase on the projected test suite (float32 matrix X)
+# (centers are drawn from a sum tree of D updated at the changed distances)
+def reductionPlusPlus(X, C, S):
+    N = len(X)
     reducedTS = []
 
-    maxCov = reduce(lambda x, y: x | y, C.values())
-
-    # distance to closest center
-    D = defaultdict(lambda:float('Inf'))
     # select first center randomly
-    selectedTC = random.randint(0, len(TS)-1)
+    selectedTC = random.randint(0, N-1)
     reducedTS.append(selectedTC + 1)
+    # squared distance to closest center
+    diff = X - X[selectedTC]
+    D = np.einsum("ij,ij->i", diff, diff).astype(np.float64)
     D[selectedTC] = 0
 
     # adequacy filtering
-    cov = C[selectedTC]
-    for tc in C.keys():
-        C[tc] = C[tc] - cov
-        if len(C[tc]) == 0:
-            D[tc] = 0
-
-    while cov != maxCov:
-        # k-means++ tc selection
-        norm = 0
-        for tc in range(len(TS)):
-            if D[tc] != 0:
-                dist = euclideanDist(TS[tc], TS[selectedTC])
-                dist *= dist
-                if dist < D[tc]:
-                    D[tc] = dist
-            norm += D[tc]
+    index = coverage.CoverageIndex(C)
+    D[index.cover(selectedTC)] = 0
+    tree = sampling.SumTree(D)
 
+    while not index.adequate():
         # safe exit point (if all distances are 0)
         # (but not all test cases have been selected)
-        if norm == 0:
-            extraTCS = set(range(1, len(TS)+1)) - set(reducedTS)
+        if tree.total() == 0:
+            extraTCS = set(range(1, N+1)) - set(reducedTS)
             extraTCS = [x-1 for x in extraTCS]
-            while cov != maxCov:
-                for tc in extraTCS:
-                    selectedTC, selTCcov = tc, len(C[tc])
-                    break
-                for tc in extraTCS:
-                    if len(C[tc]) > selTCcov:
-                        selTCcov = len(C[tc])
-                        selectedTC = tc
-                extraTCS.remove(selectedTC)
+            greedy = coverage.lazyGreedy(extraTCS, index.residual)
+            while not index.adequate():
+                selectedTC = next(greedy)
                 reducedTS.append(selectedTC + 1)
 
                 # adequacy filtering
-                cov = cov | C[selectedTC]
-                for tc in C.keys():
-                    C[tc] = C[tc] - cov
+                index.cover(selectedTC)
 
             break
 
-        s = 0
-        sel = set()
-        while s < S and cov != maxCov:
-            s += 1
-            c = 0
-            coinToss = random.random() * norm
-            for tc, dist in D.items():
-                if coinToss < c + dist:
-                    if tc not in sel:
-                        sel.add(tc)
-                    break
-                c += dist
+        # S coin tosses (duplicates are selected once)
+        sel = []
+        for s in range(S):
+            tc = tree.sample(random.random())
+            if tc not in sel:
+                sel.append(tc)
 
         for selectedTC in sel:
             reducedTS.append(selectedTC + 1)
-            D[selectedTC] = 0
 
             # adequacy filtering
-            cov = cov | C[selectedTC]
-            for tc in C.keys():
-                C[tc] = C[tc] - cov
-                if len(C[tc]) == 0:
-                    D[tc] = 0
+            useless = [selectedTC] + index.cover(selectedTC)
+            D[useless] = 0
+            tree.update(useless, D[useless])
+
+        # k-means++ tc selection: one vectorized update per new center
+        for selectedTC in sel:
+            diff = X - X[selectedTC]
+            dist = np.einsum("ij,ij->i", diff, diff)
+            closer = np.nonzero(dist < D)[0]
+            D[closer] = dist[closer]
+            tree.update(closer, D[closer])
 
     return reducedTS
 
 # FAST++ test suite reduction algorithm
 # Returns: preparation time, reduction time, reduced test suite
 def fastPlusPlus(inputFile, wBoxFile, dim=0, S=1, memory=True):
-    if memory:
-        t0 = time.clock()
-        TS = preparation(inputFile, dim=dim)
-        t1 = time.clock()
-        pTime = t1-t0
-    else:
-        rpFile = inputFile.replace(".txt", ".rp")
-        if not os.path.exists(rpFile):
-            t0 = time.clock()
-            TS = preparation(inputFile, dim=dim)
-            t1 = time.clock()
-            pTime = t1-t0
-            pickle.dump((pTime, TS), open(rpFile, "wb"))
-        else:
-            pTime, TS = pickle.load(open(rpFile, "rb"))
+    pTime, TS = fastr.prepareTestSuite(inputFile, dim=dim, memory=memory)
 
     tC0 = time.clock()
-    C = loadCoverage(wBoxFile)
+    # the reduction indexes test cases by row (tcID - 1), tests missing
+    # from the coverage file cover nothing
+    C = loader.loadCoverage(wBoxFile)
+    C = {tc: C.get(tc + 1, set()) for tc in range(len(TS))}
     tC1 = time.clock()
 
     t2 = time.clock()
@@ -498,99 +162,65 @@ def fastPlusPlus(inputFile, wBoxFile, dim=0, S=1, memory=True):
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # FAST-CS
 
-# FAST-CS Reduction phase
-def reductionCS(TS, C, simple=True):
+# FAST-CS Reduction phase on the projected test suite (float32 matrix X)
+# P is the mixture (1/2 each) of the uniform distribution over the useful tcs
+# (compact set, see sampling.CompactSet) and of the distribution
+# proportional to D (sum tree): each draw costs O(log N), P is never built
+def reductionCS(X, C, simple=True):
+    N = len(X)
     reducedTS = []
 
-    maxCov = reduce(lambda x, y: x | y, C.values())
-    cov = set()
-
-    # compute center of mass
-    centerOfMass = defaultdict(float)
-    for tc in TS:
-        for k, v in tc.items():
-            centerOfMass[k] += v
-    # normalize
-    for k in centerOfMass.keys():
-        centerOfMass[k] /= len(TS)
-
-    # compute distances
-    D = defaultdict(float)
-    norm = 0
-    for tc in range(len(TS)):
-        dist = euclideanDist(TS[tc], centerOfMass)
-        D[tc] = dist*dist
-        norm += D[tc]
-
-    uselessTCS = set()
-    while cov != maxCov:
-        # compute probabilities of being sampled
-        P = []
-        if norm != 0:
-            p = 1.0 / (2*(len(TS)-len(uselessTCS)))
-            for tc in range(len(TS)):
-                P.append(p + D[tc] / (2*norm))
-        else:
-            P = [1.0 / (len(TS)-len(uselessTCS))] * len(TS)
-
-        for tc in uselessTCS:
-            P[tc] = 0.0
-
-        # numeric error: when sum of P != 1
-        toSelect = set(range(len(TS))) - uselessTCS - {x-1 for x in reducedTS}
-        P[random.choice(list(toSelect))] += 1.0 - sum(P)
-
-        # proportional sampling
-        if simple:
-            selectedTC = np.random.choice(list(range(len(TS))), p=P, replace=False)
-            reducedTS.append(selectedTC + 1)
-            # adequate filtering
-            cov = cov | C[selectedTC]
-            for tc in C.keys():
-                C[tc] = C[tc] - cov
-                if len(C[tc]) == 0:
-                    uselessTCS.add(tc)
-                    norm -= D[tc]
-                    D[tc] = 0
-
-        else:
-            selectedTCS = np.random.choice(list(range(len(TS))), size=1+int(math.log(len(TS), 2)), p=P, replace=False)
-            for selectedTC in selectedTCS:
-                reducedTS.append(selectedTC + 1)
-                # adequate filtering
-                cov = cov | C[selectedTC]
+    index = coverage.CoverageIndex(C)
+
+    # compute center of mass and distances
+    diff = X - X.mean(axis=0, dtype=np.float64)
+    tree = sampling.SumTree(np.einsum("ij,ij->i", diff, diff))
+
+    useful = sampling.CompactSet(range(N))
+
+    # remove tcs from the sampling (selected or useless)
+    def discard(tcs):
+        tcs = [tc for tc in tcs if tc in useful]
+        for tc in tcs:
+            useful.remove(tc)
+        tree.update(tcs, 0.0)
+
+    while not index.adequate():
+        # weights of the two components of P at the beginning of the draws
+        numOfUseful, norm = len(useful), tree.total()
+
+        # proportional sampling (without replacement if not simple)
+        draws = 1 if simple else min(1+int(math.log(N, 2)), len(useful))
+        selectedTCS = []
+        for _ in range(draws):
+            uniform = len(useful) / float(numOfUseful)
+            proportional = tree.total() / norm if norm != 0 else 0.0
+            coinToss = np.random.random_sample() * (uniform + proportional)
+            if coinToss < uniform:
+                selectedTC = int(
+                    useful.array()[np.random.randint(len(useful))])
+            else:
+                selectedTC = tree.sample(np.random.random_sample())
+            selectedTCS.append(selectedTC)
+            discard([selectedTC])
 
+        for selectedTC in selectedTCS:
+            reducedTS.append(selectedTC + 1)
             # adequate filtering
-            for tc in C.keys():
-                C[tc] = C[tc] - cov
-                if len(C[tc]) == 0:
-                    uselessTCS.add(tc)
-                    norm -= D[tc]
-                    D[tc] = 0
+            discard(index.cover(selectedTC))
 
     return reducedTS
 
 # FAST-CS test suite reduction algorithm
 # Returns: preparation time, reduction time, reduced test suite
 def fastCS(inputFile, wBoxFile, dim=0, memory=True, simple=True):
-    if memory:
-        t0 = time.clock()
-        TS = preparation(inputFile, dim=dim)
-        t1 = time.clock()
-        pTime = t1-t0
-    else:
-        rpFile = inputFile.replace(".txt", ".rp")
-        if not os.path.exists(rpFile):
-            t0 = time.clock()
-            TS = preparation(inputFile, dim=dim)
-            t1 = time.clock()
-            pTime = t1-t0
-            pickle.dump((pTime, TS), open(rpFile, "wb"))
-        else:
-            pTime, TS = pickle.load(open(rpFile, "rb"))
+    pTime, TS = fastr.prepareTestSuite(inputFile, dim=dim, memory=memory)
 
     tC0 = time.clock()
-    C = loadCoverage(wBoxFile)
+    # the reduction indexes test cases by row (tcID - 1), tests missing
+    # from the coverage file cover nothing
+    C = loader.loadCoverage(wBoxFile)
+    C = {tc: C.get(tc + 1, set()) for tc in range(len(TS))}
     tC1 = time.clock()
 
     t2 = time.clock()
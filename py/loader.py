@@ -0,0 +1,122 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from collections import OrderedDict
+import locale
+import random
+
+import numpy as np
+
+import lsh
+
+"""
+This file implements the streaming loader of test suites shared by all
+FAST-R modules (one test case per line, tcID = line number from 1):
+ - bbox: source code of the test case -> array of k-shingles (lsh)
+ - wbox: space-separated covered entities -> set of entities
+Test cases are read lazily; a shuffled order is a permutation of tcIDs
+read through the line offsets of the file, not a copy of the suite.
+"""
+
+# encoding used by open() in text mode
+ENCODING = locale.getpreferredencoding(False)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# LINES
+
+# line without its terminator
+def stripLine(line):
+    if line.endswith("\n"):
+        line = line[:-1]
+    if line.endswith("\r"):
+        line = line[:-1]
+    return line
+
+# read the lines of input file lazily (without terminator)
+def readLines(input_file):
+    with open(input_file) as fin:
+        for line in fin:
+            yield stripLine(line)
+
+# byte offsets of the lines of input file (N+1 values, the last is the size)
+def lineOffsets(input_file, block=2**24):
+    offsets, position, last = [np.zeros(1, dtype=np.int64)], 0, b""
+    with open(input_file, "rb") as fin:
+        for data in iter(lambda: fin.read(block), b""):
+            newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) ==
+                                      ord("\n"))
+            offsets.append(newlines.astype(np.int64) + position + 1)
+            position += len(data)
+            last = data[-1:]
+    if position > 0 and last != b"\n":
+        offsets.append(np.array([position], dtype=np.int64))
+    return np.concatenate(offsets)
+
+# number of test cases of input file
+def countTestCases(input_file):
+    return sum((1 for _ in open(input_file)))
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TEST CASES
+
+# parse a line: shingles (bbox) or covered entities (wbox)
+def parseTestCase(line, bbox=False, k=5):
+    if bbox:
+        return lsh.rollingShingles(line, k)
+    return set(line.split())
+
+# random order of the test cases (permutation of tcIDs)
+def permutation(numOfTCS):
+    order = list(range(1, numOfTCS+1))
+    random.shuffle(order)
+    return np.array(order, dtype=np.int64)
+
+# read test cases lazily as pairs (tcID, shingles/entities)
+def readTestCases(input_file, bbox=False, k=5, order=None):
+    """INPUT
+    (str)input_file: path of the test suite
+    (bool)bbox: True for source code (shingles), False for coverage
+    (int)k: size of the shingles (bbox)
+    (np.array)order: tcIDs in order of reading (default: file order)
+
+    OUTPUT
+    (generator)test_cases: pairs (tcID, shingle array or set of entities)"""
+    if order is None:
+        for tcID, line in enumerate(readLines(input_file), 1):
+            yield tcID, parseTestCase(line, bbox, k)
+        return
+
+    offsets = lineOffsets(input_file)
+    with open(input_file, "rb") as fin:
+        for tcID in order:
+            lo, hi = offsets[tcID-1], offsets[tcID]
+            fin.seek(lo)
+            line = stripLine(fin.read(hi - lo).decode(ENCODING))
+            yield int(tcID), parseTestCase(line, bbox, k)
+
+# load the test suite in memory in random order
+def loadTestSuite(input_file, bbox=False, k=5, shuffle=True):
+    """OUTPUT
+    (OrderedDict)TS: key=tcID, val=shingle array (bbox) or set of entities"""
+    order = permutation(countTestCases(input_file)) if shuffle else None
+    return OrderedDict(readTestCases(input_file, bbox, k, order))
+
+# load coverage (only for wbox usage)
+def loadCoverage(wBoxFile):
+    """OUTPUT
+    (dict)C: key=tcID (line number, from 1), val=set of covered entities"""
+    return dict(readTestCases(wBoxFile))
@@ -17,6 +17,7 @@ from collections import defaultdict
 from collections import OrderedDict
 import itertools
 
+import numpy as np
 import xxhash
 
 """
@@ -29,21 +30,64 @@ prioritization algorithms.
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # SHINGLING
 
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# base of the polynomial rolling hash and its inverse (mod 2^64)
+ROLLING_BASE = 0x100000001B3
+ROLLING_INVERSE = pow(ROLLING_BASE, 2**63 - 1, 2**64)
+
+
+# murmur3 64-bit finalizer (seeded), applied in place to a uint64 array
+def fmix64(values, seed=0):
+    values ^= np.uint64(seed & MASK64)
+    values ^= values >> np.uint64(33)
+    values *= np.uint64(0xFF51AFD7ED558CCD)
+    values ^= values >> np.uint64(33)
+    values *= np.uint64(0xC4CEB9FE1A85EC53)
+    values ^= values >> np.uint64(33)
+    return values
+
+# hash the k-shingles of a string with a seeded polynomial rolling hash
+def rollingShingles(tc, k, seed=0):
+    """INPUT
+    (str)tc: source code of a test case
+    (int)k: size of k-shingles
+    (int)seed: seed of the hash function
+
+    OUTPUT
+    (np.array)shingles: sorted uint64 array of distinct k-shingle hashes"""
+    codes = np.frombuffer(tc.encode("utf-32-le"), dtype="<u4")
+    length = len(codes) - k + 1
+    if length <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    # H_i = sum_j c_{i+j} P^(k-1-j) = P^(i+k-1) (S_{i+k} - S_i), where
+    # S_m = sum_{t<m} c_t P^-t is computed in one pass as a prefix sum
+    powers = np.full(len(codes) + k, ROLLING_BASE, dtype=np.uint64)
+    powers[0] = 1
+    powers = np.cumprod(powers, dtype=np.uint64)
+    inverses = np.full(len(codes), ROLLING_INVERSE, dtype=np.uint64)
+    inverses[0] = 1
+    inverses = np.cumprod(inverses, dtype=np.uint64)
+    prefix = np.zeros(len(codes) + 1, dtype=np.uint64)
+    np.cumsum(codes * inverses, dtype=np.uint64, out=prefix[1:])
+    shingles = powers[k - 1:k - 1 + length] * (prefix[k:] - prefix[:length])
+
+    # seeded final mixing (murmur3 fmix64)
+    return np.unique(fmix64(shingles, seed))
+
 # return the k-shingles of an input test suite.
-def kShingles(TS, k):
+def kShingles(TS, k, seed=0):
     """INPUT
-    (dict)TS: key=tcID, value=(set of entities)
+    (dict)TS: key=tcID, value=(source code of test case)
     (int)k: size of k-shingles
+    (int)seed: seed of the shingle hash function
 
     OUTPUT
-    (dict)shingles: key=tcID, value=set of k-shingles of test case ID"""
+    (dict)shingles: key=tcID, value=uint64 array of k-shingles of test case ID"""
     shingles = OrderedDict()
     for tcID in TS:
-        tc = TS[tcID]
-        shingle = set()
-        for i in range(len(tc) - k + 1):
-            shingle.add(hash(tc[i:i + k]))
-        shingles[tcID] = shingle
+        shingles[tcID] = rollingShingles(TS[tcID], k, seed)
 
     return shingles
 
@@ -80,6 +124,200 @@ def tcMinhashing(test_case, hash_functions):
     return tc_signature
 
 
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# VECTORIZED MINWISEHASHING
+
+# max value of a vectorized minhash (signature of the empty set)
+MAXHASH = np.iinfo(np.uint64).max
+
+# map the shingles of a test case to an array of 64-bit integers
+def shingleArray(tc_shingles):
+    """INPUT
+    (iterable)tc_shingles: integer shingles or string entities, or a uint64
+    array of already hashed shingles (e.g. from rollingShingles)
+
+    OUTPUT
+    (np.array)shingles: uint64 array with one value per shingle"""
+    if isinstance(tc_shingles, np.ndarray):
+        return tc_shingles.astype(np.uint64, copy=False)
+    tc_shingles = list(tc_shingles)
+    if len(tc_shingles) > 0 and isinstance(tc_shingles[0], str):
+        values = (xxhash.xxh64(s).intdigest() for s in tc_shingles)
+        return np.fromiter(values, dtype=np.uint64, count=len(tc_shingles))
+    # structured integers (e.g. consecutive IDs) bias the multiply-add-shift
+    # family of minhashFamily: mix them first
+    values = (s & MASK64 for s in tc_shingles)
+    return fmix64(np.fromiter(values, dtype=np.uint64,
+                              count=len(tc_shingles)))
+
+# generate a vectorized family of n universal hash functions
+def minhashFamily(n, seed=0):
+    """INPUT
+    (int)n: number of hash functions
+    (int)seed: seed of the random hash parameters
+
+    OUTPUT
+    (fun)hashMembers: maps a list of uint64 shingle arrays to the matrix of
+    their minhash signatures (one row per array, one column per function)"""
+    rs = np.random.RandomState(seed)
+    # multiply-add-shift hashing: h_i(x) = ((a_i * x + b_i) mod 2^64) >> 32
+    a = rs.randint(0, 2**32, size=n, dtype=np.uint64) << np.uint64(32)
+    a |= rs.randint(0, 2**32, size=n, dtype=np.uint64) | np.uint64(1)
+    b = rs.randint(0, 2**32, size=n, dtype=np.uint64) << np.uint64(32)
+    b |= rs.randint(0, 2**32, size=n, dtype=np.uint64)
+
+    def hashMembers(tcs_shingles):
+        lengths = np.array([len(s) for s in tcs_shingles], dtype=np.int64)
+        signatures = np.full((len(lengths), n), MAXHASH, dtype=np.uint64)
+        nonempty = lengths > 0
+        if not nonempty.any():
+            return signatures
+
+        shingles = np.concatenate([s for s in tcs_shingles if len(s) > 0])
+        hashes = (shingles[:, None] * a + b) >> np.uint64(32)
+        offsets = np.cumsum(lengths) - lengths
+        signatures[nonempty] = np.minimum.reduceat(
+            hashes, offsets[nonempty], axis=0)
+        return signatures
+
+    return hashMembers
+
+# number of densification attempts of one permutation hashing
+DENSIFICATION_ATTEMPTS = 64
+
+# seeded parameters of one permutation hashing with n bins: key of the hash
+# function and sequences of bins of the densification
+def onePermutationParameters(n, seed=0):
+    rs = np.random.RandomState(seed)
+    key = rs.randint(0, 2**32, size=2, dtype=np.uint64)
+    key = (key[0] << np.uint64(32)) | key[1]
+    sequences = rs.randint(0, n, size=(DENSIFICATION_ATTEMPTS, n))
+    return key, sequences
+
+# generate a vectorized one permutation hashing scheme with n bins
+def onePermutationFamily(n, seed=0, densified=True):
+    """INPUT
+    (int)n: number of bins (i.e., size of the signatures)
+    (int)seed: seed of the hash function and of the densification
+    (bool)densified: fill the empty bins (False: they are left to MAXHASH)
+
+    OUTPUT
+    (fun)hashMembers: maps a list of uint64 shingle arrays to the matrix of
+    their signatures (one row per array, one column per bin)
+
+    Each shingle is hashed once: the high bits of the hash select a bin and
+    the low 32 bits are the value kept if minimum in the bin. Empty bins are
+    filled with optimal densification (see densification). Densified bins
+    hold borrowed values, so only undensified signatures can be merged with
+    np.minimum into the signature of a union."""
+    key = onePermutationParameters(n, seed)[0]
+    densify = densification(n, seed)
+
+    def hashMembers(tcs_shingles):
+        lengths = np.array([len(s) for s in tcs_shingles], dtype=np.int64)
+        signatures = np.full((len(lengths), n), MAXHASH, dtype=np.uint64)
+        nonempty = lengths > 0
+        if not nonempty.any():
+            return signatures
+
+        shingles = np.concatenate([s for s in tcs_shingles if len(s) > 0])
+        owners = np.repeat(np.arange(len(lengths)), lengths)
+        # seeded murmur3 fmix64
+        hashes = shingles ^ key
+        hashes ^= hashes >> np.uint64(33)
+        hashes *= np.uint64(0xFF51AFD7ED558CCD)
+        hashes ^= hashes >> np.uint64(33)
+        hashes *= np.uint64(0xC4CEB9FE1A85EC53)
+        hashes ^= hashes >> np.uint64(33)
+        bins = ((hashes >> np.uint64(32)) * np.uint64(n)) >> np.uint64(32)
+        values = hashes & np.uint64(0xFFFFFFFF)
+        np.minimum.at(signatures, (owners, bins.astype(np.int64)), values)
+        return densify(signatures) if densified else signatures
+
+    return hashMembers
+
+# generate the densification of one permutation hashing signatures
+def densification(n, seed=0):
+    """INPUT
+    (int)n: number of bins (i.e., size of the signatures)
+    (int)seed: seed of the one permutation hashing scheme
+
+    OUTPUT
+    (fun)densify: maps an undensified signature (or matrix of signatures) to
+    its densified copy
+
+    Optimal densification: empty bin i of a non-empty signature borrows the
+    value of the first non-empty bin in a fixed random sequence of bins for
+    i (the first non-empty bin if all the attempts hit empty bins)."""
+    sequences = onePermutationParameters(n, seed)[1]
+
+    def densify(signatures):
+        signatures = np.array(signatures, dtype=np.uint64)
+        single = signatures.ndim == 1
+        signatures = signatures.reshape(-1, n)
+        filled = signatures != MAXHASH
+        empty = ~filled & filled.any(axis=1)[:, None]
+        for attempt in range(DENSIFICATION_ATTEMPTS):
+            if not empty.any():
+                break
+            source = sequences[attempt]
+            borrow = empty & filled[:, source]
+            signatures[borrow] = signatures[:, source][borrow]
+            empty &= ~borrow
+        if empty.any():
+            rows, cols = np.nonzero(empty)
+            first = np.argmax(filled, axis=1)
+            signatures[rows, cols] = signatures[rows, first[rows]]
+        return signatures[0] if single else signatures
+
+    return densify
+
+# signature of the empty set (i.e., identity of the signature union)
+def emptySignature(n):
+    return np.full(n, MAXHASH, dtype=np.uint64)
+
+# compute minhashing of chunks of test cases with a vectorized family
+def chunkMinhashing(test_cases, hash_family, chunk=2**18):
+    """INPUT
+    (iterable)test_cases: pairs (tcID, set of entities)
+    (fun)hash_family: vectorized hash family (see minhashFamily and
+    onePermutationFamily)
+    (int)chunk: max number of shingles hashed at once
+
+    OUTPUT
+    (generator)chunks: pairs (list of tcIDs, matrix of signatures)"""
+    tc_IDs, tcs_shingles, size = [], [], 0
+    for tc_ID, tc_shingles in test_cases:
+        tc_IDs.append(tc_ID)
+        tcs_shingles.append(shingleArray(tc_shingles))
+        size += len(tcs_shingles[-1])
+        if size >= chunk:
+            yield tc_IDs, hash_family(tcs_shingles)
+            tc_IDs, tcs_shingles, size = [], [], 0
+    if len(tc_IDs) > 0:
+        yield tc_IDs, hash_family(tcs_shingles)
+
+# compute minhashing of a whole test suite with a vectorized family
+def suiteMinhashing(test_cases, hash_family, chunk=2**18):
+    """INPUT
+    (iterable)test_cases: pairs (tcID, set of entities)
+    (fun)hash_family: vectorized hash family (see minhashFamily and
+    onePermutationFamily)
+    (int)chunk: max number of shingles hashed at once
+
+    OUTPUT
+    (list)tc_IDs: IDs of the test cases
+    (np.array)signatures: matrix of signatures, one row per tcID"""
+    tc_IDs, signatures = [], []
+    for chunk_IDs, chunk_signatures in chunkMinhashing(
+            test_cases, hash_family, chunk):
+        tc_IDs.extend(chunk_IDs)
+        signatures.append(chunk_signatures)
+    if len(signatures) == 0:
+        return tc_IDs, np.empty((0, 0), dtype=np.uint64)
+    return tc_IDs, np.concatenate(signatures)
+
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # LOCALITY SENSITIVE HASHING (LSH)
 
@@ -140,6 +378,170 @@ def LSHCandidates(bucket, signature, b, r, n):
     return candidates
 
 
+# compute the key of each band of packed integer signatures
+def bandKeys(signatures, b, r):
+    """INPUT
+    (np.array)signatures: uint64 signature (n) or matrix of signatures (N x n)
+    (int)b: number of bands
+    (int)r: number of rows
+
+    OUTPUT
+    (np.array)keys: N x b uint64 matrix of band keys"""
+    signatures = np.asarray(signatures, dtype=np.uint64).reshape(-1, b * r)
+    bands = signatures.reshape(len(signatures), b, r)
+    # polynomial hashing of the rows of each band (mod 2^64)
+    keys = np.zeros((len(signatures), b), dtype=np.uint64)
+    for j in range(r):
+        keys = keys * np.uint64(0x100000001B3) + bands[:, :, j]
+    # final mixing (murmur3 fmix64)
+    keys ^= keys >> np.uint64(33)
+    keys *= np.uint64(0xFF51AFD7ED558CCD)
+    keys ^= keys >> np.uint64(33)
+    return keys
+
+# incrementally updatable LSH index for fast similarity-based search
+class LSHIndex:
+    """LSH buckets supporting insertion, removal and query of test cases.
+    Each slot keeps the band keys of the indexed test cases in a sorted
+    array, and a query looks its own keys up with searchsorted. Removing a
+    test case only marks it as removed (O(1)): removed entries are filtered
+    out of the query results and dropped when the arrays are rebuilt, i.e.
+    when new test cases are merged in or half of the entries are removed.
+    Multi-probe (probes > 0) is done on the index side by dropping rows:
+    each band is also indexed, and queried, with the keys obtained by
+    dropping one of its first `probes` rows, so a query also visits the test
+    cases whose band differs from its own in one of these rows. This raises
+    the recall per band (fewer hash functions for the same candidates), but
+    the index holds b * (1 + probes) slots: (1 + probes) times the memory
+    of plain LSH. It needs r > 1: with one row per band, the key without
+    that row is the same for every test case.
+
+    INPUT
+    (int)b: number of bands
+    (int)r: number of rows
+    (iterable)minhashes: pairs (tcID, uint64 signature) to insert, tcIDs
+    are non-negative integers
+    (int)probes: number of rows dropped per band, each one adding b slots
+    (0 <= probes <= r)"""
+
+    def __init__(self, b, r, minhashes=(), probes=0):
+        assert(0 <= probes <= r and (probes == 0 or r > 1))
+        self.b, self.r, self.n = b, r, b * r
+        self.probes = probes
+        self.slots = b * (1 + probes)
+        # sorted keys of each slot (band, perturbed row) and their entries
+        self.sortedKeys = np.empty((self.slots, 0), dtype=np.uint64)
+        self.sortedEntries = np.empty((self.slots, 0), dtype=np.int64)
+        # inserted entries not merged in the sorted arrays yet
+        self.pending = []
+        # tcID of each entry, in order of insertion
+        self.entryIDs = np.empty(0, dtype=np.int64)
+        self.count = 0
+        # key=tcID, val=its current entry (-1 if not indexed)
+        self.entries = np.empty(0, dtype=np.int64)
+        self.size = 0
+
+        minhashes = list(minhashes)
+        if len(minhashes) > 0:
+            self.insertMany([tc_ID for tc_ID, signature in minhashes],
+                            np.array([sig for tc_ID, sig in minhashes]))
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, tc_ID):
+        return 0 <= tc_ID < len(self.entries) and self.entries[tc_ID] >= 0
+
+    # bytes of the arrays of the index (pending entries excluded)
+    @property
+    def nbytes(self):
+        return (self.sortedKeys.nbytes + self.sortedEntries.nbytes +
+                self.entryIDs.nbytes + self.entries.nbytes)
+
+    # keys of each slot of a matrix of integer signatures
+    def slotKeys(self, signatures):
+        keys = [bandKeys(signatures, self.b, self.r)]
+        bands = np.asarray(signatures, dtype=np.uint64).reshape(
+            -1, self.b, self.r)
+        for row in range(self.probes):
+            perturbed = np.delete(bands, row, axis=2).reshape(len(bands), -1)
+            keys.append(bandKeys(perturbed, self.b, self.r - 1))
+        return np.stack(keys, axis=2).reshape(len(bands), -1)
+
+    def insert(self, tc_ID, signature):
+        self.insertMany([tc_ID], np.asarray(signature)[None])
+
+    # insert test cases with a matrix of integer signatures
+    def insertMany(self, tc_IDs, signatures):
+        tc_IDs = np.asarray(tc_IDs, dtype=np.int64).reshape(-1)
+        if len(tc_IDs) == 0:
+            return
+        new = np.arange(self.count, self.count + len(tc_IDs))
+        self.pending.append((new, self.slotKeys(signatures).T))
+
+        self.entryIDs = grow(self.entryIDs, self.count + len(tc_IDs), 0)
+        self.entryIDs[new] = tc_IDs
+        self.count += len(tc_IDs)
+        self.entries = grow(self.entries, int(tc_IDs.max()) + 1, -1)
+        self.size += len(np.unique(tc_IDs[self.entries[tc_IDs] < 0]))
+        # a test case inserted again replaces its previous entry
+        self.entries[tc_IDs] = new
+
+    def remove(self, tc_ID):
+        if tc_ID not in self:
+            raise KeyError(tc_ID)
+        self.entries[tc_ID] = -1
+        self.size -= 1
+
+    # mask of the entries that are the current entry of their test case
+    def alive(self, entries):
+        return self.entries[self.entryIDs[entries]] == entries
+
+    # merge the pending entries and drop the removed ones
+    def rebuild(self):
+        keys = np.concatenate(
+            [self.sortedKeys] + [keys for new, keys in self.pending], axis=1)
+        entries = np.concatenate(
+            [self.sortedEntries] +
+            [np.broadcast_to(new, keys.shape) for new, keys in self.pending],
+            axis=1)
+        self.pending = []
+
+        # every slot holds every entry once: same number of alive entries
+        alive = self.alive(entries)
+        keys = keys[alive].reshape(self.slots, -1)
+        entries = entries[alive].reshape(self.slots, -1)
+        order = np.argsort(keys, axis=1, kind="stable")
+        self.sortedKeys = np.take_along_axis(keys, order, axis=1)
+        self.sortedEntries = np.take_along_axis(entries, order, axis=1)
+
+    # return the sorted array of indexed test cases possibly similar to
+    # signature
+    def query(self, signature):
+        if len(self.pending) > 0 or self.sortedKeys.shape[1] > 2 * self.size:
+            self.rebuild()
+
+        keys = self.slotKeys(signature)[0]
+        found = []
+        for slot in range(self.slots):
+            lo = np.searchsorted(self.sortedKeys[slot], keys[slot], "left")
+            hi = np.searchsorted(self.sortedKeys[slot], keys[slot], "right")
+            if hi > lo:
+                found.append(self.sortedEntries[slot, lo:hi])
+        if len(found) == 0:
+            return np.empty(0, dtype=np.int64)
+        found = np.concatenate(found)
+        return np.unique(self.entryIDs[found[self.alive(found)]])
+
+# extend an array to (at least) size, filling the new cells with fill
+def grow(array, size, fill):
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # JACCARD SIMILARITY/DISTANCE EXACT AND ESTIMATES
 
@@ -151,6 +553,55 @@ def jSimilarity(a, b):
 def jDistance(a, b):
     return 1.0 - jSimilarity(a, b)
 
+# number of set bits of each byte value
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# number of set bits of each row of a matrix of packed uint64 bitsets
+def popcount(bitsets):
+    bitsets = np.ascontiguousarray(bitsets, dtype=np.uint64)
+    counts = POPCOUNT[bitsets.view(np.uint8)]
+    return counts.reshape(bitsets.shape[:-1] + (-1,)).sum(axis=-1,
+                                                           dtype=np.int64)
+
+# exact jaccard distances between two sets of packed bitsets
+def jDistanceBitsets(A, B, block=2**22):
+    """INPUT
+    (np.array)A: m x W matrix of packed uint64 bitsets
+    (np.array)B: p x W matrix of packed uint64 bitsets
+    (int)block: max number of words intersected at once
+
+    OUTPUT
+    (np.array)distances: m x p matrix of exact jaccard distances
+    (the distance between two empty sets is 0)"""
+    A, B = np.asarray(A, dtype=np.uint64), np.asarray(B, dtype=np.uint64)
+    sizeA, sizeB = popcount(A), popcount(B)
+    distances = np.empty((len(A), len(B)))
+    step = max(1, block // max(1, B.size))
+    for i in range(0, len(A), step):
+        inter = popcount(A[i:i + step, None, :] & B[None, :, :])
+        union = sizeA[i:i + step, None] + sizeB[None, :] - inter
+        distances[i:i + step] = 1.0 - np.where(
+            union > 0, inter / np.maximum(union, 1), 1.0)
+    return distances
+
+# manhattan (L1) distances between two sets of 0/1 vectors as packed bitsets
+# (number of entities covered by only one of the two: popcount(a xor b))
+def manhattanDistanceBitsets(A, B, block=2**22):
+    """INPUT
+    (np.array)A: m x W matrix of packed uint64 bitsets
+    (np.array)B: p x W matrix of packed uint64 bitsets
+    (int)block: max number of words compared at once
+
+    OUTPUT
+    (np.array)distances: m x p matrix of manhattan distances"""
+    A, B = np.asarray(A, dtype=np.uint64), np.asarray(B, dtype=np.uint64)
+    distances = np.empty((len(A), len(B)), dtype=np.int64)
+    step = max(1, block // max(1, B.size))
+    for i in range(0, len(A), step):
+        distances[i:i + step] = popcount(A[i:i + step, None, :] ^
+                                         B[None, :, :])
+    return distances
+
 # estimate jaccard similarity using minhashing
 def jSimilarityEstimate(s1, s2):
     assert(len(s1) == len(s2))
@@ -159,3 +610,31 @@ def jSimilarityEstimate(s1, s2):
 # estimate jaccard distance using minhashing
 def jDistanceEstimate(s1, s2):
     return 1.0 - jSimilarityEstimate(s1, s2)
+
+# estimate jaccard distances between a signature and many signatures
+def jDistanceEstimates(s, signatures):
+    """INPUT
+    (np.array)s: signature
+    (np.array)signatures: m x n matrix of signatures
+
+    OUTPUT
+    (np.array)distances: m estimated jaccard distances"""
+    return 1.0 - np.mean(np.asarray(signatures) == np.asarray(s), axis=1)
+
+# return the signature farthest from s (the first one in case of ties)
+def farthestSignature(s, signatures, rows=None):
+    """INPUT
+    (np.array)s: signature
+    (np.array)signatures: m x n matrix of signatures
+    (np.array)rows: indices of the candidate signatures (default: all)
+
+    OUTPUT
+    (int)row: index of the farthest signature
+    (float)distance: its estimated jaccard distance from s"""
+    if rows is not None:
+        signatures = signatures[rows]
+    distances = jDistanceEstimates(s, signatures)
+    i = int(np.argmax(distances))
+    if rows is not None:
+        return int(rows[i]), float(distances[i])
+    return i, float(distances[i])
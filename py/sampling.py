@@ -0,0 +1,171 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import random
+
+import numpy as np
+
+"""
+This file implements the weighted random sampling used by FAST-R, and the
+compact set of the items that can still be sampled.
+"""
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# WEIGHTED SAMPLING WITHOUT REPLACEMENT
+
+# weighted sampling without replacement (Efraimidis-Spirakis exponential keys)
+def weightedSample(weights, size):
+    """INPUT
+    (np.array)weights: non-negative weight of each item
+    (int)size: number of items to sample
+
+    OUTPUT
+    (np.array)sample: indices of the sampled items, in sampling order
+
+    Each item gets the key log(u)/w (u uniform in (0, 1)): the items with the
+    largest keys, in decreasing order, are distributed as successive draws
+    proportional to the weights (as np.random.choice with replace=False).
+    Items of weight 0 are sampled last, uniformly at random."""
+    weights = np.asarray(weights, dtype=np.float64)
+    size = min(size, len(weights))
+    positive = np.nonzero(weights > 0)[0]
+    keys = np.log(1.0 - np.random.random_sample(len(positive)))
+    keys /= weights[positive]
+
+    if size < len(positive):
+        top = np.argpartition(-keys, size - 1)[:size]
+    else:
+        top = np.arange(len(positive))
+    sample = positive[top[np.argsort(-keys[top], kind="mergesort")]]
+
+    if size > len(positive):
+        zero = np.nonzero(weights <= 0)[0]
+        sample = np.concatenate(
+            [sample, np.random.permutation(zero)[:size - len(positive)]])
+    return sample
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# DYNAMIC WEIGHTED SAMPLING
+
+class SumTree:
+    """Weights of N items in the leaves of a complete binary tree whose
+    internal nodes hold the sum of their children: a weight update and a
+    draw proportional to the weights cost O(log N). Node sums are recomputed
+    from the children (not updated by differences), so they do not
+    accumulate rounding errors and are exactly 0 when all weights are 0.
+
+    INPUT
+    (np.array)weights: non-negative weight of each item"""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        self.size = len(weights)
+        # leaves are tree[capacity:capacity+size], the root is tree[1]
+        self.capacity = 1 << max(self.size - 1, 0).bit_length()
+        self.tree = np.zeros(2 * self.capacity)
+        self.tree[self.capacity:self.capacity + self.size] = weights
+        level = self.capacity // 2
+        while level > 0:
+            self.tree[level:2*level] = (self.tree[2*level:4*level:2] +
+                                        self.tree[2*level+1:4*level:2])
+            level //= 2
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, item):
+        return self.tree[self.capacity + item]
+
+    def total(self):
+        return self.tree[1]
+
+    # set the weights of items (array of indices) to weights
+    def update(self, items, weights):
+        nodes = np.asarray(items, dtype=np.int64) + self.capacity
+        if len(nodes) == 0:
+            return
+        self.tree[nodes] = weights
+        while nodes[0] > 1:
+            nodes = np.unique(nodes >> 1)
+            self.tree[nodes] = self.tree[2*nodes] + self.tree[2*nodes+1]
+
+    # item drawn with probability proportional to its weight
+    def sample(self, u):
+        """INPUT
+        (float)u: uniform random number in [0, 1)
+
+        OUTPUT
+        (int)item: first item whose cumulative weight exceeds u * total
+        (None if all weights are 0)"""
+        if self.tree[1] <= 0:
+            return None
+        u *= self.tree[1]
+        node = 1
+        while node < self.capacity:
+            left = self.tree[2*node]
+            # never descend into a subtree of weight 0 (rounding of u)
+            if u < left or self.tree[2*node+1] <= 0:
+                node = 2*node
+            else:
+                u -= left
+                node = 2*node + 1
+        return node - self.capacity
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# UNIFORM SAMPLING FROM A SHRINKING SET
+
+class CompactSet:
+    """Set of non-negative integers in a compact array: removal swaps the
+    last item in, so removal, membership and a uniform draw cost O(1).
+
+    INPUT
+    (iterable)items: the (distinct) items of the set"""
+
+    def __init__(self, items):
+        self.items = np.fromiter(items, dtype=np.int64)
+        # items[:size] are in the set, position is their index in items
+        self.size = len(self.items)
+        self.position = np.full(int(self.items.max(initial=-1)) + 1,
+                                self.size, dtype=np.int64)
+        self.position[self.items] = np.arange(self.size)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, item):
+        return 0 <= item < len(self.position) and \
+            self.position[item] < self.size
+
+    # items of the set, in no particular order (a view: copy it to keep it)
+    def array(self):
+        return self.items[:self.size]
+
+    def keys(self):
+        return self.array().tolist()
+
+    # random item (without building the list of the items)
+    def choice(self):
+        return int(self.items[random.randrange(self.size)])
+
+    # remove an item of the set
+    def remove(self, item):
+        i = self.position[item]
+        self.size -= 1
+        last = self.items[self.size]
+        self.items[i], self.position[last] = last, i
+        self.items[self.size], self.position[item] = item, self.size
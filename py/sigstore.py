@@ -0,0 +1,93 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+
+import numpy as np
+
+"""
+This file implements the binary signature store used by FAST-R when
+signatures are precomputed on disk (memory=False).
+Format: a 64 bytes header (magic string followed by the little-endian int64
+fields version, n, r, b, k, count, oph) and the count x n matrix of uint64
+signatures in row-major order (oph = 1 for one permutation hashing, stored
+undensified: empty bins are MAXHASH).
+The matrix is memory-mapped at load time, so loading is (almost) instant and
+concurrent processes share the same pages.
+"""
+
+MAGIC = b"FASTRSIG"
+VERSION = 3
+HEADER_SIZE = 64
+FIELDS = ("version", "n", "r", "b", "k", "count", "oph")
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# encode the header of a signature store
+def encodeHeader(r, b, k, count, oph=False):
+    values = np.array([VERSION, r * b, r, b, k, count, int(oph)], dtype="<i8")
+    header = MAGIC + values.tobytes()
+    return header + b"\0" * (HEADER_SIZE - len(header))
+
+# read the header of a signature store
+def loadHeader(sigfile):
+    """INPUT
+    (str)sigfile: path of the signature store
+
+    OUTPUT
+    (dict)header: key=field, value=int (None if sigfile is not a store)"""
+    if not os.path.exists(sigfile):
+        return None
+    with open(sigfile, "rb") as fin:
+        header = fin.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        return None
+    values = np.frombuffer(header, dtype="<i8", count=len(FIELDS),
+                           offset=len(MAGIC))
+    return dict(zip(FIELDS, (int(v) for v in values)))
+
+# write chunks of signatures (uint64 matrices with r*b columns) to sigfile
+def storeSignatures(sigfile, chunks, r, b, k, oph=False):
+    n, count = r * b, 0
+    tmpfile = "{}.{}.tmp".format(sigfile, os.getpid())
+    with open(tmpfile, "wb") as fout:
+        fout.write(encodeHeader(r, b, k, count, oph))
+        for signatures in chunks:
+            signatures = np.ascontiguousarray(signatures, dtype="<u8")
+            assert(signatures.shape[1] == n)
+            fout.write(signatures.tobytes())
+            count += len(signatures)
+        fout.seek(0)
+        fout.write(encodeHeader(r, b, k, count, oph))
+    # atomic rename: concurrent readers never see a partial store
+    os.replace(tmpfile, sigfile)
+
+# memory-map the signatures of a store
+def loadSignatures(sigfile):
+    """INPUT
+    (str)sigfile: path of the signature store
+
+    OUTPUT
+    (dict)header: key=field, value=int
+    (np.array)signatures: read-only count x n uint64 matrix"""
+    header = loadHeader(sigfile)
+    assert(header is not None)
+    shape = (header["count"], header["n"])
+    if header["count"] == 0:
+        return header, np.empty(shape, dtype=np.uint64)
+    signatures = np.memmap(sigfile, dtype="<u8", mode="r",
+                           offset=HEADER_SIZE, shape=shape)
+    return header, signatures
@@ -0,0 +1,201 @@
+'''
+This is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This software is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this source.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import random
+import sys
+import time
+
+import numpy as np
+
+import loader
+import lsh
+
+"""
+This file implements a tuner for the LSH stage of FAST-pw and FAST-f.
+It samples the test suite, estimates the distribution of the pairwise
+Jaccard similarities from minhash signatures, and picks the shingle size k
+and the number of rows r and bands b whose expected candidate set per
+LSH query is closest to a target size.
+For each configuration it reports the predicted query time and index memory,
+extrapolated from an LSHIndex built on the sample. Multi-probe indexes every
+band (1 + probes) times: it reaches the target with fewer hash functions, but
+its index memory grows with the number of probes.
+"""
+
+
+usage = """USAGE: python3 py/tuner.py <inputFile> <representation> <target>
+OPTIONS:
+  <inputFile>: the test suite, e.g. input/flex_v3/flex-bbox.txt
+  <representation>: the format of the test suite.
+    options: bbox (source code of one test case per line), wbox (covered entities)
+  <target>: desired number of candidates returned by each LSH query.
+    options: positive integer value, e.g. 100"""
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# SAMPLING
+
+# uniform sample (reservoir) of the test cases of input file
+def sampleTestCases(input_file, m, seed=0):
+    """INPUT
+    (str)input_file: path of the test suite
+    (int)m: size of the sample
+    (int)seed: seed of the sampling
+
+    OUTPUT
+    (int)N: number of test cases of the suite
+    (list)sample: m test cases (lines of input_file)"""
+    rs = random.Random(seed)
+    sample, N = [], 0
+    with open(input_file) as fin:
+        for tc in fin:
+            N += 1
+            if len(sample) < m:
+                sample.append(loader.stripLine(tc))
+            else:
+                i = rs.randrange(N)
+                if i < m:
+                    sample[i] = loader.stripLine(tc)
+    return N, sample
+
+# shingles of the sampled test cases
+def sampleShingles(sample, bbox, k):
+    if bbox:
+        return [lsh.rollingShingles(tc, k) for tc in sample]
+    return [lsh.shingleArray(set(tc.split())) for tc in sample]
+
+# estimated jaccard similarity of all pairs of sampled test cases
+def pairwiseSimilarities(signatures):
+    m = len(signatures)
+    similarities = [np.mean(signatures[i + 1:] == signatures[i], axis=1)
+                    for i in range(m - 1)]
+    if len(similarities) == 0:
+        return np.empty(0)
+    return np.concatenate(similarities)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# MODEL
+
+# probability that two test cases with similarity s collide in some band
+# (with multi-probe, a band also collides if they differ in one dropped row)
+def collisionProbability(s, r, b, probes=0):
+    band = s ** r + probes * s ** (r - 1) * (1 - s) if probes > 0 else s ** r
+    return 1.0 - (1.0 - band) ** b
+
+# fit the cost of LSHIndex queries and the memory per indexed key
+def calibrate(shingles, configs, probes=0):
+    """INPUT
+    (list)shingles: uint64 shingle arrays of the sampled test cases
+    (list)configs: pairs (r, b) used for the calibration
+    (int)probes: number of rows dropped per band (multi-probe)
+
+    OUTPUT
+    (np.array)costs: seconds per query, per probed slot, per candidate
+    (float)entry_bytes: bytes of index per (test case, slot)"""
+    X, y, entry_bytes = [], [], []
+    for r, b in configs:
+        tc_IDs, signatures = lsh.suiteMinhashing(
+            enumerate(shingles), lsh.minhashFamily(r * b))
+        p = min(probes, r) if r > 1 else 0
+
+        index = lsh.LSHIndex(b, r, zip(tc_IDs, signatures), p)
+        index.query(signatures[0])  # merges the inserted test cases
+        entry_bytes.append(index.nbytes / float(len(tc_IDs) * b * (1 + p)))
+
+        for signature in signatures:
+            t0 = time.perf_counter()
+            candidates = index.query(signature)
+            y.append(time.perf_counter() - t0)
+            X.append((1.0, b * (1 + p), len(candidates)))
+
+    costs = np.linalg.lstsq(np.array(X), np.array(y), rcond=None)[0]
+    return np.maximum(costs, 0.0), float(np.mean(entry_bytes))
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TUNER
+
+# pick k, r, b whose expected LSH candidate set is closest to target
+def tune(input_file, target, bbox=True, ks=(3, 5, 7), rs=range(1, 9),
+         bs=range(1, 33), probes=0, sample=200, n_estimate=128, seed=0):
+    """INPUT
+    (str)input_file: path of the test suite
+    (int)target: desired number of candidates per LSH query
+    (bool)bbox: True for source code, False for coverage (k is unused and
+    left out of the output)
+    (iterable)ks, rs, bs: values of k, r, b to consider
+    (int)probes: number of rows dropped per band (multi-probe, index
+    memory grows with 1 + probes)
+    (int)sample: number of sampled test cases
+    (int)n_estimate: number of hash functions for the similarity estimates
+    (int)seed: seed of sampling and hashing
+
+    OUTPUT
+    (dict)best: key=parameter (k, r, b, n, probes), value=chosen value
+    (list)report: one dict per configuration (k, r, b, n, candidates,
+    query time in seconds, index memory in bytes), best first"""
+    N, tcs = sampleTestCases(input_file, sample, seed)
+    if not bbox:
+        ks = ks[:1]
+
+    costs, entry_bytes = calibrate(
+        sampleShingles(tcs, bbox, ks[len(ks) // 2]), [(1, 10), (2, 5), (4, 8)],
+        probes)
+
+    report = []
+    for k in ks:
+        shingles = sampleShingles(tcs, bbox, k)
+        tc_IDs, signatures = lsh.suiteMinhashing(
+            enumerate(shingles), lsh.minhashFamily(n_estimate, seed))
+        similarities = pairwiseSimilarities(signatures)
+        for r in rs:
+            p = min(probes, r) if r > 1 else 0
+            for b in bs:
+                collisions = np.mean(collisionProbability(similarities, r, b, p))
+                candidates = N * float(collisions)
+                slots = b * (1 + p)
+                config = {
+                    "r": r, "b": b, "n": r * b, "probes": p,
+                    "candidates": candidates,
+                    "time": costs[0] + costs[1] * slots + costs[2] * candidates,
+                    "memory": N * slots * entry_bytes}
+                if bbox:
+                    config["k"] = k
+                report.append(config)
+
+    # closest to target (in ratio), then cheapest signatures and queries
+    report.sort(key=lambda c: (round(abs(np.log((c["candidates"] + 1.0) /
+                                                (target + 1.0))), 1),
+                               c["n"], c["time"]))
+    best = {key: report[0][key] for key in ("k", "r", "b", "n", "probes")
+            if key in report[0]}
+    return best, report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print(usage)
+        exit()
+
+    script, inputFile, representation, target = sys.argv
+    best, report = tune(inputFile, int(target), bbox=(representation == "bbox"))
+
+    params = ("k", "r", "b", "n") if representation == "bbox" else ("r", "b", "n")
+    print(" ".join(params), "candidates query_time(ms) index_memory(MB)")
+    for c in report[:10]:
+        print(*[c[key] for key in params], round(c["candidates"], 1),
+              round(c["time"] * 1000, 4), round(c["memory"] / 2**20, 2))
+    print("BEST", best)